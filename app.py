@@ -1,18 +1,34 @@
 import os
+import sys
 import shutil
 import time
 import shortuuid
+import uuid
 import zipfile
 import tempfile
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import wraps, lru_cache
+from collections import deque
 from flask import Flask, render_template, request, send_from_directory, jsonify, abort, send_file, session, redirect, url_for, after_this_request
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, send_file as werkzeug_send_file
 from werkzeug.security import generate_password_hash, check_password_hash
-from PIL import Image
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.sansio.multipart import MultipartDecoder, NeedData, Epilogue, Field, File, Data
+from PIL import Image, features as pil_features
 import io
+import json
+import base64
+import hashlib
+import struct
+import zlib
+import unicodedata
+from urllib.parse import quote as url_quote
+import signal
 import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 app = Flask(__name__)
 
@@ -20,10 +36,19 @@ app = Flask(__name__)
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 STORAGE_DIR = os.path.join(BASE_DIR, 'storage')
 FOLDERZIP_DIR = os.path.join(BASE_DIR, 'folderzip')
+THUMB_CACHE_DIR = os.path.join(BASE_DIR, 'thumbcache')
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///disk.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# SQLite 等待锁的超时时间，后台索引线程和请求线程会同时写库
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 * 1024  # 16GB 最大上传大小
+app.config['THUMB_CACHE_MAX_BYTES'] = 512 * 1024 * 1024  # 缩略图缓存占用上限，超出后按最近使用时间淘汰
+app.config['ZIP_CACHE_MAX_BYTES'] = 20 * 1024 * 1024 * 1024  # 打包下载缓存（folderzip）占用上限，超出后按最近使用时间淘汰
+app.config['RENDER_WORKERS'] = os.cpu_count() or 1  # 缩略图/Office 渲染进程数
+app.config['RENDER_TIMEOUT'] = 60  # 单个渲染任务的超时（秒）
+app.config['RENDER_MEMORY_LIMIT'] = 1024 * 1024 * 1024  # 每个渲染进程在启动时占用之外最多可再分配的内存
+app.config['ZIP_WORKERS'] = os.cpu_count() or 1  # 打包下载时并行压缩的线程数（所有下载共用）
 app.secret_key = 'your_secret_key_here' # 用于Session加密
 
 # Session 配置 - 防止下载时 session 丢失
@@ -42,17 +67,17 @@ GITHUB_URL = 'https://github.com/Chiyang001?tab=repositories'
 BILIBILI_URL = 'https://space.bilibili.com/404891612'
 PROJECT_URL = 'https://github.com/Chiyang001/NetDisk'
 
-if not os.path.exists(STORAGE_DIR):
-    os.makedirs(STORAGE_DIR)
-
-if not os.path.exists(FOLDERZIP_DIR):
-    os.makedirs(FOLDERZIP_DIR)
-
-if not os.path.exists(STATIC_DIR):
-    os.makedirs(STATIC_DIR)
-
 db = SQLAlchemy(app)
 
+# 启用 WAL 模式，读写互不阻塞
+with app.app_context():
+    @db.event.listens_for(db.engine, 'connect')
+    def _set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
 # --- 数据库模型：分享链接 ---
 class ShareLink(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -77,8 +102,73 @@ class PasswordResetToken(db.Model):
     expire_at = db.Column(db.DateTime, nullable=False)
     used = db.Column(db.Boolean, default=False)
 
-# 初始化数据库
-with app.app_context():
+# --- 数据库模型：文件元数据索引 ---
+class FileEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.Text, unique=True, nullable=False) # 相对 storage 的路径，根目录为空字符串
+    parent = db.Column(db.Text, nullable=True, index=True) # 父目录相对路径，根目录为 None
+    name = db.Column(db.Text, nullable=False)
+    is_dir = db.Column(db.Boolean, default=False)
+    size = db.Column(db.BigInteger, default=0)
+    mtime = db.Column(db.Float, default=0)
+    inode = db.Column(db.BigInteger, nullable=True)
+    file_type = db.Column(db.String(20), index=True)
+    scanned_mtime = db.Column(db.Float, nullable=True) # 目录：最近一次同步子条目时目录自身的 mtime
+    total_size = db.Column(db.BigInteger, default=0) # 目录：递归总大小；文件：等于 size
+    file_count = db.Column(db.Integer, default=0) # 目录：递归文件数；文件：1
+    content_hash = db.Column(db.String(64), nullable=True, index=True) # 文件内容 SHA-256，由后处理流水线计算
+    media_meta = db.Column(db.Text, nullable=True) # 图片/Office 文档元数据（JSON）
+
+# --- 数据库模型：上传后处理任务队列 ---
+class IngestTask(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.Text, nullable=False, index=True) # 相对 storage 的文件路径
+    status = db.Column(db.String(10), default='pending', index=True) # pending, running, failed
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+# --- 数据库模型：后台任务 ---
+class Job(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False) # paste, delete, extract, zip
+    params = db.Column(db.Text, nullable=False) # 任务参数（JSON）
+    status = db.Column(db.String(10), default='pending', index=True) # pending, running, done, failed, cancelled
+    total_bytes = db.Column(db.BigInteger, nullable=True) # 未知时为 None
+    done_bytes = db.Column(db.BigInteger, default=0)
+    total_files = db.Column(db.Integer, nullable=True)
+    done_files = db.Column(db.Integer, default=0)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    result = db.Column(db.Text, nullable=True) # 执行结果（JSON）
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True) # 执行期间定期刷新，作为心跳
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+# --- 数据库模型：分块上传会话 ---
+class UploadSession(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    path = db.Column(db.Text, nullable=False) # 目标文件相对 storage 的路径
+    staging = db.Column(db.Text, nullable=False) # 暂存文件相对 storage 的路径（与目标同目录的隐藏文件）
+    size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+class UploadChunk(db.Model):
+    upload_id = db.Column(db.String(32), primary_key=True)
+    chunk = db.Column(db.Integer, primary_key=True) # 已完整写入暂存文件的分块序号
+
+# --- 初始化数据库 ---
+# 数据库结构或默认设置有变化（新增迁移）时加 1；已完成的版本记录在 SQLite 的 user_version 中
+SCHEMA_VERSION = 3
+
+def init_database():
+    """创建数据表、迁移旧数据库并写入默认设置；由 create_app() 在文件锁内调用，每个结构版本只执行一次"""
+    with db.engine.connect() as conn:
+        if conn.execute(db.text('PRAGMA user_version')).scalar() >= SCHEMA_VERSION:
+            return
+    
     db.create_all()
     
     # 检查并添加新字段（兼容旧数据库）
@@ -99,6 +189,46 @@ with app.app_context():
         except Exception as alter_error:
             print(f"数据库更新失败（可能已经更新过）: {alter_error}")
     
+    try:
+        FileEntry.query.with_entities(FileEntry.total_size, FileEntry.file_count).first()
+    except Exception as e:
+        db.session.rollback()
+        print("检测到文件索引需要更新，正在添加目录统计字段...")
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(db.text("ALTER TABLE file_entry ADD COLUMN total_size BIGINT DEFAULT 0"))
+                conn.execute(db.text("ALTER TABLE file_entry ADD COLUMN file_count INTEGER DEFAULT 0"))
+                # 旧索引没有目录统计，清空后由启动时的对账任务重建
+                conn.execute(db.text("DELETE FROM file_entry"))
+                conn.commit()
+                print("文件索引更新完成")
+        except Exception as alter_error:
+            print(f"文件索引更新失败: {alter_error}")
+    
+    try:
+        FileEntry.query.with_entities(FileEntry.content_hash, FileEntry.media_meta).first()
+    except Exception as e:
+        db.session.rollback()
+        print("检测到文件索引需要更新，正在添加内容哈希和元数据字段...")
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(db.text("ALTER TABLE file_entry ADD COLUMN content_hash VARCHAR(64)"))
+                conn.execute(db.text("ALTER TABLE file_entry ADD COLUMN media_meta TEXT"))
+                conn.execute(db.text("CREATE INDEX IF NOT EXISTS ix_file_entry_content_hash ON file_entry (content_hash)"))
+                conn.commit()
+                print("文件索引更新完成")
+        except Exception as alter_error:
+            print(f"文件索引更新失败: {alter_error}")
+    
+    # 部分索引：只包含尚未同步过子条目的目录，对账完成后为空，查询统计是否完整时不用扫描整棵子树
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(db.text("CREATE INDEX IF NOT EXISTS ix_file_entry_unscanned ON file_entry (path) "
+                                 "WHERE is_dir = 1 AND scanned_mtime IS NULL"))
+            conn.commit()
+    except Exception as e:
+        print(f"创建文件索引失败: {e}")
+    
     # 初始化默认设置
     if not Settings.query.filter_by(key='password_hash').first():
         default_hash = generate_password_hash(DEFAULT_PASSWORD)
@@ -128,6 +258,10 @@ with app.app_context():
         db.session.add(Settings(key='security_answer', value=''))
     
     db.session.commit()
+    
+    with db.engine.connect() as conn:
+        conn.execute(db.text(f'PRAGMA user_version = {SCHEMA_VERSION}'))
+        conn.commit()
 
 # --- 辅助函数：获取设置 ---
 def get_setting(key, default=None):
@@ -159,30 +293,400 @@ def is_default_password():
         return check_password_hash(password_hash, DEFAULT_PASSWORD)
     return True
 
-# --- 辅助函数：清理过期的 ZIP 文件 ---
-def cleanup_old_zips():
-    """删除超过24小时的 ZIP 文件"""
+def enforce_cache_budget(cache_dir, max_bytes, keep=(), stats=None):
+    """缓存目录总大小超过 max_bytes 时，按 mtime 从旧到新删除文件，直到降到上限的 90%
+
+    命中缓存时会刷新文件 mtime，因此 mtime 即最近使用时间；keep 中的路径（正在使用的文件）不会被删除。
+    stats 不为 None 时在其中累计淘汰的文件数（evictions）和字节数（evicted_bytes）。
+    返回删除后的目录总大小。
+    """
+    entries = []
+    total = 0
+    stack = [cache_dir]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+                        total += st.st_size
+        except OSError:
+            continue
+    
+    if total <= max_bytes:
+        return total
+    
+    target = max_bytes * 0.9
+    for mtime, size, path in sorted(entries):
+        if total <= target:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            if stats is not None:
+                stats['evictions'] += 1
+                stats['evicted_bytes'] += size
+        except OSError:
+            pass
+    return total
+
+# --- 辅助函数：渲染进程池 ---
+# Pillow 缩略图和 Office 文档转换在独立进程中执行：多核并行，不和请求线程争抢 GIL。
+# 每个渲染进程通过自己的管道接收任务，异常文档超时或超出内存上限时只终止执行它的那个进程，
+# 下一个任务再启动新进程；其他渲染进程中进行中的任务不受影响，也不会拖垮 Web 进程
+RENDER_RECYCLE_JOBS = 500  # 每个渲染进程执行这么多任务后退出，由新进程替换，回收内存碎片
+RENDER_KILL_GRACE = 5      # 任务超时后进程内未能中断（卡在 C 扩展中），再等待几秒后强制终止该进程
+_render_idle = []          # 空闲的渲染进程
+_render_slots = None       # 同时执行的渲染任务数上限（RENDER_WORKERS）
+_render_thread_pool = None # 不支持 fork 的平台使用的线程池
+_render_pool_lock = threading.Lock()
+
+def _render_worker_init(memory_limit):
+    """渲染进程初始化：在 fork 继承来的地址空间之上限制可再分配的内存"""
     try:
-        now = time.time()
-        for filename in os.listdir(FOLDERZIP_DIR):
-            filepath = os.path.join(FOLDERZIP_DIR, filename)
-            if os.path.isfile(filepath) and filename.endswith('.zip'):
-                file_age = now - os.path.getmtime(filepath)
-                if file_age > 24 * 3600:  # 24小时
-                    os.remove(filepath)
-                    print(f"已删除过期 ZIP 文件: {filename}")
-    except Exception as e:
-        print(f"清理 ZIP 文件失败: {e}")
+        import resource
+    except ImportError:
+        return
+    vm_size = 0
+    try:
+        with open('/proc/self/statm') as f:
+            vm_size = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = vm_size + memory_limit
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ValueError, OSError):
+        pass
 
-# --- 后台定时清理任务 ---
-def schedule_cleanup():
-    """每小时执行一次清理任务"""
-    cleanup_old_zips()
-    # 设置下次执行
-    threading.Timer(3600, schedule_cleanup).start()
+def _render_alarm(signum, frame):
+    raise TimeoutError('渲染超时')
+
+def _render_call(func, args, timeout):
+    """在渲染进程中执行任务；纯 Python 代码（如 openpyxl 遍历单元格）超时时由 SIGALRM 中断"""
+    use_alarm = hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _render_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
 
-# 启动清理任务
-schedule_cleanup()
+def _render_worker_main(conn, memory_limit):
+    """渲染进程：依次执行管道中收到的任务，结果（或异常）原样发回；收到 None 或 Web 进程已退出时退出"""
+    _render_worker_init(memory_limit)
+    parent = os.getppid()
+    while True:
+        try:
+            if not conn.poll(60):
+                # 之后启动的渲染进程也持有管道，Web 进程被强制结束时这里收不到 EOF，定期检查父进程
+                if os.getppid() != parent:
+                    return
+                continue
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        func, args, timeout = job
+        try:
+            reply = (True, _render_call(func, args, timeout))
+        except BaseException as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e: # 结果或异常无法 pickle
+            conn.send((False, RuntimeError(str(e))))
+
+class _RenderWorker:
+    """一个渲染进程及与它通信的管道"""
+    
+    def __init__(self):
+        context = multiprocessing.get_context('fork')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_render_worker_main,
+                                       args=(child_conn, app.config['RENDER_MEMORY_LIMIT']), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+    
+    def run(self, func, args, timeout):
+        """在这个进程中执行任务，返回 (是否成功, 结果或异常)；超时或进程意外退出时终止进程并抛出异常"""
+        try:
+            self.conn.send((func, args, timeout))
+            if not self.conn.poll(timeout + RENDER_KILL_GRACE):
+                raise TimeoutError('渲染超时')
+            return self.conn.recv()
+        except TimeoutError:
+            self.kill()
+            raise
+        except (EOFError, OSError):
+            # 渲染进程因超出内存限制等原因意外退出
+            self.kill()
+            raise RuntimeError('渲染进程意外退出')
+    
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+    
+    def retire(self):
+        try:
+            self.conn.send(None)
+            self.process.join(RENDER_KILL_GRACE)
+        except OSError:
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+def _render_get_slots():
+    global _render_slots
+    with _render_pool_lock:
+        if _render_slots is None:
+            _render_slots = threading.BoundedSemaphore(app.config['RENDER_WORKERS'])
+        return _render_slots
+
+def _render_take_worker():
+    with _render_pool_lock:
+        while _render_idle:
+            worker = _render_idle.pop()
+            if worker.process.is_alive():
+                return worker
+            worker.kill()
+    return _RenderWorker()
+
+def _render_release_worker(worker, healthy=True):
+    worker.jobs += 1
+    if healthy and worker.jobs < RENDER_RECYCLE_JOBS:
+        with _render_pool_lock:
+            _render_idle.append(worker)
+    else:
+        worker.retire()
+
+def _render_get_thread_pool():
+    global _render_thread_pool
+    with _render_pool_lock:
+        if _render_thread_pool is None:
+            _render_thread_pool = ThreadPoolExecutor(app.config['RENDER_WORKERS'])
+        return _render_thread_pool
+
+def run_render_job(func, *args, timeout=None):
+    """把 CPU 密集的渲染任务交给一个空闲的渲染进程并等待结果；超时抛出 TimeoutError
+    
+    func 及参数、返回值需要可以 pickle，func 必须是模块级函数。
+    """
+    timeout = timeout or app.config['RENDER_TIMEOUT']
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        # spawn 启动的子进程会重新执行 app.py，不支持 fork 的平台（Windows）退化为线程池，超时的任务无法终止
+        future = _render_get_thread_pool().submit(func, *args)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise TimeoutError('渲染超时')
+    
+    with _render_get_slots():
+        worker = _render_take_worker()
+        ok, value = worker.run(func, args, timeout)
+        # 分配内存失败后进程的状态不可靠，换一个新进程
+        _render_release_worker(worker, healthy=ok or not isinstance(value, MemoryError))
+    if not ok:
+        raise value
+    return value
+
+# --- 辅助函数：缩略图缓存 ---
+# 缓存文件名由 (路径, 大小, mtime, 尺寸) 计算，原图修改后自动生成新的缓存，旧缓存随 LRU 淘汰
+THUMB_CACHE_TOUCH_INTERVAL = 3600  # 命中时刷新 mtime 的最小间隔（秒），避免每次命中都写元数据
+_thumb_cache_lock = threading.Lock()
+_thumb_cache_bytes = None  # 缓存目录当前占用的估计值，首次写入时扫描目录得到
+
+# 缩略图尺寸预设（?size=），各页面不再写死像素值
+THUMBNAIL_PRESETS = {
+    'small': (128, 128),   # 列表视图图标
+    'medium': (256, 256),  # 网格视图
+    'large': (512, 512)    # 分享详情页
+}
+THUMBNAIL_WEBP_SUPPORTED = pil_features.check('webp')
+
+# EXIF Orientation -> 转置方式（与 ImageOps.exif_transpose 一致），在缩小后的图片上执行更省时
+_EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90
+}
+
+def render_thumbnail(abs_path, max_size, fmt='JPEG'):
+    """用 Pillow 生成缩略图，返回字节内容
+
+    JPEG 通过 draft() 让解码器直接输出 1/2、1/4、1/8 尺寸，其他格式先用 reduce() 做整数倍缩小，
+    最后再用 LANCZOS 缩放到目标尺寸，避免完整解码和在全尺寸图片上做重采样。
+    """
+    with Image.open(abs_path) as img:
+        orientation = img.getexif().get(0x0112, 1)
+        box = max_size
+        if orientation in (5, 6, 7, 8):
+            # 旋转 90 度的图片先按宽高互换后的尺寸缩小，转置后正好落在目标尺寸内
+            box = (max_size[1], max_size[0])
+        
+        # 保留 2 倍目标尺寸，给 LANCZOS 留出余量，画质与直接缩放无明显差别
+        if img.format == 'JPEG':
+            img.draft(None, (box[0] * 2, box[1] * 2))
+        if img.mode in ('P', 'PA', '1'):
+            # reduce() 不支持调色板和 1 位图片，先转换为 RGB/RGBA
+            has_alpha = img.mode == 'PA' or 'transparency' in img.info
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+        factor = min(img.width // (box[0] * 2), img.height // (box[1] * 2))
+        if factor > 1:
+            img = img.reduce(factor)
+        img.thumbnail(box, Image.Resampling.LANCZOS)
+        
+        if orientation in _EXIF_TRANSPOSE:
+            img = img.transpose(_EXIF_TRANSPOSE[orientation])
+        
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        if has_alpha and fmt == 'WEBP':
+            img = img.convert('RGBA')
+        elif has_alpha:
+            # JPEG 不支持透明，铺白色背景
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # 保存到内存
+        img_io = io.BytesIO()
+        if fmt == 'WEBP':
+            img.save(img_io, 'WEBP', quality=80, method=4)
+        else:
+            img.save(img_io, 'JPEG', quality=85)
+        return img_io.getvalue()
+
+def thumbnail_format(accept_mimetypes):
+    """浏览器在 Accept 中明确列出 image/webp 时输出 WebP，否则输出 JPEG（*/* 不算）"""
+    if THUMBNAIL_WEBP_SUPPORTED and any(mimetype == 'image/webp' and quality > 0
+                                        for mimetype, quality in accept_mimetypes):
+        return 'WEBP'
+    return 'JPEG'
+
+def thumbnail_response(abs_path, preset):
+    """按尺寸预设和 Accept 协商的格式返回缓存的缩略图；preset 由调用方先校验"""
+    max_size = THUMBNAIL_PRESETS[preset]
+    fmt = thumbnail_format(request.accept_mimetypes)
+    response = send_file(get_cached_thumbnail(abs_path, max_size, fmt),
+                         mimetype='image/webp' if fmt == 'WEBP' else 'image/jpeg')
+    response.vary.add('Accept')
+    return response
+
+def thumbnail_cache_path(abs_path, st, max_size, fmt='JPEG'):
+    raw = f"{abs_path}|{st.st_size}|{st.st_mtime_ns}|{max_size[0]}x{max_size[1]}"
+    key = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return os.path.join(THUMB_CACHE_DIR, key[:2], key + ('.webp' if fmt == 'WEBP' else '.jpg'))
+
+def _thumb_cache_add(size):
+    """记录新写入的缓存大小，超出容量时执行淘汰"""
+    global _thumb_cache_bytes
+    max_bytes = app.config['THUMB_CACHE_MAX_BYTES']
+    with _thumb_cache_lock:
+        if _thumb_cache_bytes is None:
+            _thumb_cache_bytes = enforce_cache_budget(THUMB_CACHE_DIR, max_bytes)
+        else:
+            _thumb_cache_bytes += size
+            if _thumb_cache_bytes > max_bytes:
+                _thumb_cache_bytes = enforce_cache_budget(THUMB_CACHE_DIR, max_bytes)
+
+def get_cached_thumbnail(abs_path, max_size, fmt='JPEG'):
+    """返回缩略图缓存文件路径，未命中时生成并原子写入（先写临时文件再 os.replace）"""
+    cache_path = thumbnail_cache_path(abs_path, os.stat(abs_path), max_size, fmt)
+    try:
+        st = os.stat(cache_path)
+        if time.time() - st.st_mtime > THUMB_CACHE_TOUCH_INTERVAL:
+            os.utime(cache_path)
+        return cache_path
+    except FileNotFoundError:
+        pass
+    
+    data = run_render_job(render_thumbnail, abs_path, max_size, fmt)
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _thumb_cache_add(len(data))
+    return cache_path
+
+def clear_thumbnail_cache():
+    """删除全部缩略图缓存，返回删除的文件数"""
+    global _thumb_cache_bytes
+    deleted_count = 0
+    with _thumb_cache_lock:
+        for root, dirs, files in os.walk(THUMB_CACHE_DIR):
+            for filename in files:
+                try:
+                    os.remove(os.path.join(root, filename))
+                    deleted_count += 1
+                except OSError:
+                    pass
+        _thumb_cache_bytes = None
+    return deleted_count
+
+# --- 辅助函数：交给前端 Web 服务器发送文件 ---
+# app.config['SENDFILE_MODE'] 为 'x-accel'（nginx）或 'x-sendfile'（Apache mod_xsendfile，需保持默认的 XSendFileUnescape On）时，
+# 路由完成登录和分享有效期检查后只返回响应头，文件内容由前端 Web 服务器用 sendfile(2) 发送，不再占用 Python 工作线程；
+# 条件请求和 Range 也由 Web 服务器处理。X-Accel-Redirect 通过 SENDFILE_LOCATIONS 把目录映射为 nginx 的 internal location，
+# 不在映射目录下的文件仍由 send_file 发送
+app.config['SENDFILE_MODE'] = None  # None / 'x-accel' / 'x-sendfile'
+app.config['SENDFILE_LOCATIONS'] = {STORAGE_DIR: '/_internal/storage/', FOLDERZIP_DIR: '/_internal/folderzip/'}
+
+def _sendfile_header(abs_path):
+    """返回 (响应头名称, 值)，不能交给 Web 服务器时返回 None；值按 URL 编码，中文文件名也只含 ASCII"""
+    mode = app.config['SENDFILE_MODE']
+    if mode == 'x-sendfile':
+        return 'X-Sendfile', url_quote(abs_path.replace(os.sep, '/'))
+    if mode == 'x-accel':
+        for root, location in app.config['SENDFILE_LOCATIONS'].items():
+            try:
+                if os.path.commonpath([root, abs_path]) != root:
+                    continue
+            except ValueError:  # Windows 上不在同一个盘符
+                continue
+            rel_path = os.path.relpath(abs_path, root).replace(os.sep, '/')
+            return 'X-Accel-Redirect', location.rstrip('/') + '/' + url_quote(rel_path)
+    return None
+
+def file_response(abs_path, **kwargs):
+    """代替 send_file 发送 abs_path（参数相同），按 SENDFILE_MODE 交给前端 Web 服务器发送"""
+    header = _sendfile_header(abs_path)
+    if header is None:
+        return send_file(abs_path, **kwargs)
+    response = werkzeug_send_file(abs_path, request.environ, use_x_sendfile=True, conditional=False,
+                                  response_class=app.response_class, max_age=app.get_send_file_max_age,
+                                  **kwargs)
+    del response.headers['X-Sendfile']
+    response.headers[header[0]] = header[1]
+    return response
 
 # --- 登录验证装饰器 ---
 def login_required(f):
@@ -210,45 +714,1063 @@ def get_rel_path(full_path):
     return full_path.replace(STORAGE_DIR, '').replace('\\', '/').lstrip('/')
 
 # --- 辅助函数：判断文件类型 ---
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico'}
+VIDEO_EXTS = {'.mp4', '.webm', '.ogg', '.mov', '.avi', '.mkv', '.flv', '.wmv'}
+AUDIO_EXTS = {'.mp3', '.wav', '.ogg', '.m4a', '.aac', '.flac', '.wma', '.ape', '.opus'}
+ARCHIVE_EXTS = {'.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz', '.tar.gz', '.tar.bz2', '.tar.xz'}
+OFFICE_EXTS = {'.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx'}
+
 def is_image(filename):
-    image_exts = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico'}
-    return os.path.splitext(filename.lower())[1] in image_exts
+    return os.path.splitext(filename.lower())[1] in IMAGE_EXTS
 
 def is_video(filename):
-    video_exts = {'.mp4', '.webm', '.ogg', '.mov', '.avi', '.mkv', '.flv', '.wmv'}
-    return os.path.splitext(filename.lower())[1] in video_exts
+    return os.path.splitext(filename.lower())[1] in VIDEO_EXTS
 
 def is_audio(filename):
-    audio_exts = {'.mp3', '.wav', '.ogg', '.m4a', '.aac', '.flac', '.wma', '.ape', '.opus'}
-    return os.path.splitext(filename.lower())[1] in audio_exts
+    return os.path.splitext(filename.lower())[1] in AUDIO_EXTS
 
 def is_archive(filename):
-    archive_exts = {'.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz', '.tar.gz', '.tar.bz2', '.tar.xz'}
     lower_name = filename.lower()
-    return any(lower_name.endswith(ext) for ext in archive_exts)
+    return any(lower_name.endswith(ext) for ext in ARCHIVE_EXTS)
 
 def is_office_doc(filename):
-    office_exts = {'.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx'}
-    return os.path.splitext(filename.lower())[1] in office_exts
+    return os.path.splitext(filename.lower())[1] in OFFICE_EXTS
 
 def is_pdf(filename):
     return os.path.splitext(filename.lower())[1] == '.pdf'
 
+# 扩展名 -> 类型 查找表（按 get_file_type 的判断优先级构建，后写入的不覆盖先写入的）
+_FILE_TYPE_BY_EXT = {}
+for _file_type, _exts in (('image', IMAGE_EXTS), ('video', VIDEO_EXTS), ('audio', AUDIO_EXTS),
+                          ('archive', ARCHIVE_EXTS), ('office', OFFICE_EXTS), ('pdf', {'.pdf'})):
+    for _ext in _exts:
+        _FILE_TYPE_BY_EXT.setdefault(_ext, _file_type)
+
 def get_file_type(filename):
-    if is_image(filename):
-        return 'image'
-    elif is_video(filename):
-        return 'video'
-    elif is_audio(filename):
-        return 'audio'
-    elif is_archive(filename):
+    # 一次 splitext + 查表完成分类；无扩展名的特殊名称（如 ".zip"）仍交给 is_archive 判断
+    file_type = _FILE_TYPE_BY_EXT.get(os.path.splitext(filename.lower())[1])
+    if file_type:
+        return file_type
+    if is_archive(filename):
         return 'archive'
-    elif is_office_doc(filename):
-        return 'office'
-    elif is_pdf(filename):
-        return 'pdf'
+    return 'file'
+
+# --- 辅助函数：扫描目录 ---
+def iter_dir_stats(abs_path):
+    """基于 os.scandir 遍历目录，逐个返回 (名称, 是否目录, stat 结果)
+
+    DirEntry 自带目录项类型（通常无需额外系统调用），stat() 结果也会被缓存，
+    每个条目最多一次 stat，而不是 isdir/getsize/getmtime 各一次。
+    """
+    with os.scandir(abs_path) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith('.'): continue # 隐藏文件
+            try:
+                is_dir = entry.is_dir()
+                stat_result = entry.stat()
+            except OSError:
+                # 扫描期间被删除或无权限的条目直接跳过
+                continue
+            yield name, is_dir, stat_result
+
+def make_file_item(name, is_dir, size_bytes, mtime_timestamp, req_path, file_type=None, file_count=None):
+    """构建列表页使用的条目字典；文件夹只有在传入 file_count（来自索引的递归统计）时才显示大小"""
+    size_known = not is_dir or file_count is not None
+    return {
+        'name': name,
+        'is_dir': is_dir,
+        'size': f"{size_bytes/1024/1024:.2f} MB" if size_known else "-",
+        'size_bytes': size_bytes if size_known else 0,
+        'file_count': file_count if is_dir else None,
+        'mtime': time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime_timestamp)),
+        'mtime_timestamp': mtime_timestamp,
+        'rel_path': os.path.join(req_path, name).replace('\\', '/'),
+        'file_type': 'folder' if is_dir else (file_type or get_file_type(name))
+    }
+
+def scan_directory(abs_path, req_path=''):
+    """直接扫描磁盘，一次遍历完成条目字典构建和类型分类"""
+    return [make_file_item(name, is_dir, st.st_size, st.st_mtime, req_path)
+            for name, is_dir, st in iter_dir_stats(abs_path)]
+
+# --- 辅助函数：文件元数据索引 ---
+# 索引保存在 file_entry 表中：写操作完成后增量更新，后台任务定期按目录 mtime 对账，
+# 捕获绕过本程序直接在磁盘上做的修改。
+# 每个目录行还保存递归的 total_size / file_count，条目增删改时把差值沿上级目录逐级累加，
+# 因此读取任意文件夹的大小都只需要查一行
+FILE_INDEX_RECONCILE_INTERVAL = 600  # 后台对账间隔（秒）
+_index_lock = threading.RLock()  # 串行化本进程内的索引写入；跨 worker 进程由 _index_begin_write 的写事务串行化
+
+def index_rel_path(abs_path):
+    """绝对路径 -> 索引中的相对路径（统一使用 / 分隔，根目录为空字符串）"""
+    rel = os.path.relpath(abs_path, STORAGE_DIR).replace('\\', '/')
+    return '' if rel == '.' else rel
+
+def _index_abs_path(rel):
+    return os.path.join(STORAGE_DIR, rel) if rel else STORAGE_DIR
+
+def _index_parent(rel):
+    if rel == '':
+        return None
+    return rel.rsplit('/', 1)[0] if '/' in rel else ''
+
+def _index_ancestors(rel):
+    """rel 的所有上级目录，由近到远，直到根目录"""
+    ancestors = []
+    parent = _index_parent(rel)
+    while parent is not None:
+        ancestors.append(parent)
+        parent = _index_parent(parent)
+    return ancestors
+
+def _index_row(rel, is_dir, st):
+    name = rel.rsplit('/', 1)[-1]
+    size = 0 if is_dir else st.st_size
+    return {
+        'path': rel,
+        'parent': _index_parent(rel),
+        'name': name,
+        'is_dir': is_dir,
+        'size': size,
+        'mtime': st.st_mtime,
+        'inode': st.st_ino & 0x7FFFFFFFFFFFFFFF, # SQLite INTEGER 为有符号 64 位
+        'file_type': 'folder' if is_dir else get_file_type(name),
+        'total_size': size,
+        'file_count': 0 if is_dir else 1,
+        'content_hash': None, # 内容可能已变化，由后处理流水线重新计算
+        'media_meta': None
+    }
+
+def _index_begin_write():
+    """在读取索引之前开启写事务（BEGIN IMMEDIATE）。
+    多个 worker 进程同时同步同一目录时，后来者在这里等待前一个提交，随后读到的是已更新的子条目，
+    计算出的统计差值不会被重复累加；已在事务中（同一次写操作的后续步骤）则沿用当前事务"""
+    if not db.session.connection().connection.driver_connection.in_transaction:
+        db.session.execute(db.text('BEGIN IMMEDIATE'))
+
+def _index_add_totals(paths, size_delta, count_delta):
+    """把大小和文件数的变化量累加到 paths 中的目录上"""
+    if not paths or (not size_delta and not count_delta):
+        return
+    db.session.execute(
+        db.update(FileEntry)
+        .where(FileEntry.path.in_(paths))
+        .values(total_size=FileEntry.total_size + size_delta,
+                file_count=FileEntry.file_count + count_delta)
+        .execution_options(synchronize_session=False))
+
+def _index_subtree_clause(rel):
+    """匹配 rel 的所有后代：按路径区间查询，可以走 path 唯一索引，也不受 LIKE 通配符影响"""
+    if rel == '':
+        return FileEntry.path != ''
+    return db.and_(FileEntry.path > rel + '/', FileEntry.path < rel + '0') # '0' 是 '/' 的下一个字符
+
+def _index_upsert(rel, values):
+    """写入单个条目并把统计变化传递给上级目录；已有目录保留自身的递归统计"""
+    existing = db.session.execute(
+        db.select(FileEntry.id, FileEntry.is_dir, FileEntry.total_size, FileEntry.file_count)
+        .filter_by(path=rel)).first()
+    if existing and existing.is_dir != values['is_dir']:
+        _index_delete_subtree(rel)
+        existing = None
+    
+    if existing:
+        if values['is_dir']:
+            values = {k: v for k, v in values.items() if k not in ('total_size', 'file_count')}
+        db.session.execute(db.update(FileEntry).where(FileEntry.id == existing.id).values(**values))
+        if not values['is_dir']:
+            _index_add_totals(_index_ancestors(rel), values['total_size'] - existing.total_size,
+                              values['file_count'] - existing.file_count)
     else:
-        return 'file'
+        db.session.execute(db.insert(FileEntry), [values])
+        _index_add_totals(_index_ancestors(rel), values['total_size'], values['file_count'])
+
+def _index_ensure_ancestors(rel):
+    """确保 rel 的所有上级目录都已在索引中"""
+    missing = []
+    parent = _index_parent(rel)
+    while parent is not None:
+        if db.session.execute(db.select(FileEntry.id).filter_by(path=parent)).first():
+            break
+        missing.append(parent)
+        parent = _index_parent(parent)
+    for ancestor in reversed(missing):
+        db.session.execute(db.insert(FileEntry), [_index_row(ancestor, True, os.stat(_index_abs_path(ancestor)))])
+
+def _index_delete_subtree(rel):
+    row = db.session.execute(
+        db.select(FileEntry.total_size, FileEntry.file_count).filter_by(path=rel)).first()
+    if row:
+        _index_add_totals(_index_ancestors(rel), -row.total_size, -row.file_count)
+    db.session.execute(db.delete(FileEntry).where(_index_subtree_clause(rel)))
+    db.session.execute(db.delete(FileEntry).where(FileEntry.path == rel))
+
+def index_sync_dir(abs_dir):
+    """对比磁盘与索引中某个目录的直接子条目并写入差异"""
+    with _index_lock:
+        rel = index_rel_path(abs_dir)
+        dir_stat = os.stat(abs_dir) # 扫描前先取目录 mtime，扫描期间的新变化留给下次对账
+        
+        on_disk = {name: (is_dir, st) for name, is_dir, st in iter_dir_stats(abs_dir)}
+        _index_begin_write() # 从读取子条目到提交是一个写事务，磁盘扫描放在事务外以缩短持锁时间
+        indexed = {r.name: r for r in db.session.execute(
+            db.select(FileEntry.id, FileEntry.name, FileEntry.is_dir, FileEntry.size,
+                      FileEntry.mtime, FileEntry.inode).filter_by(parent=rel))}
+        
+        inserts, updates, removed = [], [], []
+        size_delta = count_delta = 0
+        for name, (is_dir, st) in on_disk.items():
+            row = _index_row(f"{rel}/{name}" if rel else name, is_dir, st)
+            old = indexed.get(name)
+            if old is None or old.is_dir != is_dir:
+                if old is not None:
+                    # 同名的文件和文件夹互相替换，按删除后新增处理
+                    removed.append(name)
+                inserts.append(row)
+                size_delta += row['total_size']
+                count_delta += row['file_count']
+            elif (old.size, old.mtime, old.inode) != (row['size'], row['mtime'], row['inode']):
+                update = {'id': old.id, 'size': row['size'], 'mtime': row['mtime'], 'inode': row['inode']}
+                if not is_dir:
+                    update.update(total_size=row['size'], content_hash=None, media_meta=None)
+                    size_delta += row['size'] - old.size
+                updates.append(update)
+        removed.extend(name for name in indexed if name not in on_disk)
+        
+        _index_ensure_ancestors(rel)
+        dir_row = _index_row(rel, True, dir_stat)
+        dir_row['scanned_mtime'] = dir_stat.st_mtime
+        _index_upsert(rel, dir_row)
+        
+        for name in removed:
+            _index_delete_subtree(f"{rel}/{name}" if rel else name)
+        if inserts:
+            db.session.execute(db.insert(FileEntry), inserts)
+        if updates:
+            db.session.execute(db.update(FileEntry), updates)
+        _index_add_totals([rel] + _index_ancestors(rel), size_delta, count_delta)
+        db.session.commit()
+
+def index_sync_tree(abs_root, only_stale=False):
+    """同步整个子树；only_stale 为 True 时只重新扫描 mtime 与上次同步时不一致的目录"""
+    stack = [abs_root]
+    while stack:
+        abs_dir = stack.pop()
+        rel = index_rel_path(abs_dir)
+        try:
+            dir_mtime = os.stat(abs_dir).st_mtime
+        except OSError:
+            continue
+        row = db.session.execute(db.select(FileEntry.scanned_mtime).filter_by(path=rel)).first()
+        if not only_stale or row is None or row.scanned_mtime != dir_mtime:
+            index_sync_dir(abs_dir)
+        child_dirs = db.session.execute(
+            db.select(FileEntry.name).filter_by(parent=rel, is_dir=True)).scalars().all()
+        stack.extend(os.path.join(abs_dir, name) for name in child_dirs)
+
+def index_hook(func):
+    """写操作完成后更新索引；索引出错只记录日志，不影响文件操作本身"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _index_lock:
+            try:
+                _index_begin_write()
+                return func(*args, **kwargs)
+            except Exception as e:
+                db.session.rollback()
+                print(f"更新文件索引失败: {e}")
+    return wrapper
+
+@index_hook
+def index_update_path(abs_path):
+    """新建或修改了 abs_path（上传、新建文件夹、复制、解压），目录会同步整个子树"""
+    rel = index_rel_path(abs_path)
+    st = os.stat(abs_path)
+    is_dir = os.path.isdir(abs_path)
+    _index_ensure_ancestors(rel)
+    _index_upsert(rel, _index_row(rel, is_dir, st))
+    db.session.commit()
+    if is_dir:
+        index_sync_tree(abs_path)
+
+@index_hook
+def index_remove_path(abs_path):
+    """abs_path 已被删除"""
+    _index_delete_subtree(index_rel_path(abs_path))
+    db.session.commit()
+
+@index_hook
+def index_update_paths(abs_paths):
+    """批量新建了多个条目（批量粘贴）：每个上级目录只同步一次，新建的目录同步整个子树"""
+    for abs_dir in {os.path.dirname(abs_path) for abs_path in abs_paths}:
+        index_sync_dir(abs_dir)
+    for abs_path in abs_paths:
+        if os.path.isdir(abs_path):
+            index_sync_tree(abs_path)
+
+@index_hook
+def index_move_path(old_abs_path, new_abs_path):
+    """abs_path 被重命名或移动，子条目整体改写路径前缀"""
+    _index_move(old_abs_path, new_abs_path)
+    db.session.commit()
+
+@index_hook
+def index_move_paths(moves):
+    """批量移动 [(原路径, 新路径)]，在一个事务中提交"""
+    for old_abs_path, new_abs_path in moves:
+        _index_move(old_abs_path, new_abs_path)
+    db.session.commit()
+
+def _index_move(old_abs_path, new_abs_path):
+    old_rel = index_rel_path(old_abs_path)
+    new_rel = index_rel_path(new_abs_path)
+    old = db.session.execute(
+        db.select(FileEntry.id, FileEntry.total_size, FileEntry.file_count).filter_by(path=old_rel)).first()
+    if not old:
+        # 原路径尚未入索引，直接按新建处理
+        index_update_path(new_abs_path)
+        return
+    
+    _index_delete_subtree(new_rel)
+    _index_ensure_ancestors(new_rel)
+    suffix_start = len(old_rel) + 1
+    db.session.execute(
+        db.update(FileEntry)
+        .where(_index_subtree_clause(old_rel))
+        .values(path=db.literal(new_rel) + db.func.substr(FileEntry.path, suffix_start),
+                parent=db.literal(new_rel) + db.func.substr(FileEntry.parent, suffix_start))
+        .execution_options(synchronize_session=False))
+    
+    # 条目自身的递归统计随之移动：从旧的上级目录中扣除，加到新的上级目录上
+    row = _index_row(new_rel, os.path.isdir(new_abs_path), os.stat(new_abs_path))
+    del row['total_size'], row['file_count'], row['content_hash'], row['media_meta']
+    db.session.execute(db.update(FileEntry).where(FileEntry.id == old.id).values(**row))
+    _index_add_totals(_index_ancestors(old_rel), -old.total_size, -old.file_count)
+    _index_add_totals(_index_ancestors(new_rel), old.total_size, old.file_count)
+
+def index_refresh_dir(abs_dir):
+    """目录 mtime 与上次同步时不一致则先增量同步"""
+    rel = index_rel_path(abs_dir)
+    dir_mtime = os.stat(abs_dir).st_mtime
+    row = db.session.execute(db.select(FileEntry.scanned_mtime).filter_by(path=rel)).first()
+    if row is None or row.scanned_mtime != dir_mtime:
+        index_sync_dir(abs_dir)
+
+def _index_unscanned_query(rel):
+    """rel 子树中尚未同步过子条目的目录（由上级目录同步时插入），它们的上级目录统计还不完整"""
+    # is_dir = 1 必须以字面量出现（而不是绑定参数），SQLite 才会使用部分索引
+    return (db.select(FileEntry.path)
+            .where(FileEntry.is_dir == db.true(), FileEntry.scanned_mtime.is_(None), _index_subtree_clause(rel)))
+
+def _index_unscanned_children(rel):
+    """rel 的直接子目录中，子树统计还不完整的目录名称"""
+    start = len(rel) + 1 if rel else 0
+    return {path[start:].split('/', 1)[0] for path in db.session.execute(_index_unscanned_query(rel)).scalars()}
+
+def list_indexed_directory(abs_dir, req_path='', file_type=None):
+    """从索引读取目录列表；子树尚未完整扫描的文件夹不显示大小，等待后台对账补全"""
+    index_refresh_dir(abs_dir)
+    rel = index_rel_path(abs_dir)
+    
+    query = db.select(FileEntry.name, FileEntry.is_dir, FileEntry.total_size, FileEntry.mtime,
+                      FileEntry.file_type, FileEntry.file_count).filter_by(parent=rel)
+    if file_type:
+        query = query.filter_by(file_type=file_type)
+    rows = db.session.execute(query).all()
+    unscanned = _index_unscanned_children(rel) if any(r.is_dir for r in rows) else set()
+    return [make_file_item(r.name, r.is_dir, r.total_size, r.mtime, req_path, r.file_type,
+                           r.file_count if r.is_dir and r.name not in unscanned else None)
+            for r in rows]
+
+def index_folder_totals(abs_dir):
+    """子文件夹的递归统计，用于列表 ETag：深层目录变化不会改变当前目录的 mtime"""
+    rel = index_rel_path(abs_dir)
+    try:
+        totals = db.session.execute(
+            db.select(db.func.count(FileEntry.id), db.func.sum(FileEntry.total_size),
+                      db.func.sum(FileEntry.file_count))
+            .filter_by(parent=rel, is_dir=True)).one()
+        # 子树扫描完成后大小从 "-" 变为实际值，统计本身不一定变化
+        return tuple(totals) + (len(_index_unscanned_children(rel)),)
+    except Exception as e:
+        db.session.rollback()
+        print(f"读取文件索引失败: {e}")
+        return None
+
+def walk_folder_stats(abs_dir):
+    """直接遍历磁盘统计文件夹大小和文件数（索引不可用时使用）"""
+    total_size = file_count = 0
+    for dirpath, dirnames, filenames in os.walk(abs_dir):
+        for f in filenames:
+            fp = os.path.join(dirpath, f)
+            if os.path.exists(fp):
+                total_size += os.path.getsize(fp)
+                file_count += 1
+    return total_size, file_count
+
+def get_folder_stats(abs_dir):
+    """返回文件夹的递归 (总大小, 文件数)：直接读取索引中的统计，尚未入索引或子树未扫描完时先同步该子树"""
+    rel = index_rel_path(abs_dir)
+    query = db.select(FileEntry.total_size, FileEntry.file_count).filter_by(path=rel, is_dir=True)
+    try:
+        row = db.session.execute(query).first()
+        if row is None:
+            index_update_path(abs_dir)
+            row = db.session.execute(query).first()
+        elif db.session.execute(db.select(FileEntry.scanned_mtime).filter_by(path=rel)).scalar() is None or \
+                db.session.execute(_index_unscanned_query(rel).limit(1)).first():
+            index_sync_tree(abs_dir, only_stale=True)
+            row = db.session.execute(query).first()
+        if row is not None:
+            return row.total_size, row.file_count
+    except Exception as e:
+        db.session.rollback()
+        print(f"读取文件夹统计失败，改为直接遍历: {e}")
+    return walk_folder_stats(abs_dir)
+
+def list_directory_items(abs_dir, req_path='', file_type=None):
+    """列表页读取目录：优先走索引，索引不可用时回退到直接扫描磁盘"""
+    try:
+        return list_indexed_directory(abs_dir, req_path, file_type)
+    except Exception as e:
+        db.session.rollback()
+        print(f"读取文件索引失败，改为直接扫描: {e}")
+        files_list = scan_directory(abs_dir, req_path)
+        if file_type:
+            files_list = [f for f in files_list if f['file_type'] == file_type]
+        return files_list
+
+def reconcile_file_index():
+    """按目录 mtime 对账整个存储目录，补上绕过本程序的修改"""
+    with app.app_context():
+        try:
+            index_sync_tree(STORAGE_DIR, only_stale=True)
+        except Exception as e:
+            db.session.rollback()
+            print(f"文件索引对账失败: {e}")
+
+def schedule_file_index_reconcile(delay=FILE_INDEX_RECONCILE_INTERVAL):
+    """后台定时对账，首次启动时立即执行一次以建立索引"""
+    def run():
+        reconcile_file_index()
+        schedule_file_index_reconcile()
+    timer = threading.Timer(delay, run)
+    timer.daemon = True
+    timer.start()
+
+# --- 辅助函数：文件搜索 ---
+# file_entry_fts 是 file_entry 的外部内容 FTS5 表（trigram 分词），由触发器随索引同步，
+# 任意位置的子串匹配都能走倒排索引，不需要遍历磁盘或全表扫描
+SEARCH_PAGE_SIZE = 100
+SEARCH_FTS_ENABLED = False  # 当前 SQLite 不支持 FTS5 trigram 时回退到 LIKE 查询
+_file_entry_fts = db.table('file_entry_fts', db.column('rowid'))
+
+def init_file_search_index():
+    global SEARCH_FTS_ENABLED
+    with app.app_context():
+        try:
+            with db.engine.connect() as conn:
+                exists = conn.execute(db.text(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name='file_entry_fts'")).first()
+                if not exists:
+                    conn.execute(db.text(
+                        "CREATE VIRTUAL TABLE file_entry_fts USING fts5("
+                        "name, path, content='file_entry', content_rowid='id', tokenize='trigram')"))
+                    conn.execute(db.text(
+                        "CREATE TRIGGER file_entry_fts_ai AFTER INSERT ON file_entry BEGIN "
+                        "INSERT INTO file_entry_fts(rowid, name, path) VALUES (new.id, new.name, new.path); END"))
+                    conn.execute(db.text(
+                        "CREATE TRIGGER file_entry_fts_ad AFTER DELETE ON file_entry BEGIN "
+                        "INSERT INTO file_entry_fts(file_entry_fts, rowid, name, path) "
+                        "VALUES ('delete', old.id, old.name, old.path); END"))
+                    # 只在名称或路径变化时更新，目录统计的频繁累加不会触发全文索引写入
+                    conn.execute(db.text(
+                        "CREATE TRIGGER file_entry_fts_au AFTER UPDATE OF name, path ON file_entry BEGIN "
+                        "INSERT INTO file_entry_fts(file_entry_fts, rowid, name, path) "
+                        "VALUES ('delete', old.id, old.name, old.path); "
+                        "INSERT INTO file_entry_fts(rowid, name, path) VALUES (new.id, new.name, new.path); END"))
+                    conn.execute(db.text("INSERT INTO file_entry_fts(file_entry_fts) VALUES ('rebuild')"))
+                    conn.commit()
+            SEARCH_FTS_ENABLED = True
+        except Exception as e:
+            print(f"创建文件名全文索引失败，搜索将使用 LIKE 查询: {e}")
+
+def parse_search_time(value):
+    """时间过滤参数：支持 Unix 时间戳或 YYYY-MM-DD"""
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(datetime.strptime(value, '%Y-%m-%d').timetuple())
+
+def search_file_index(keyword, scope='name', file_types=None, under=None, min_size=None, max_size=None,
+                      mtime_from=None, mtime_to=None, after_id=0, limit=SEARCH_PAGE_SIZE):
+    """在索引中搜索文件，按 id 顺序返回 limit 条，after_id 为上一页最后一条的 id"""
+    column = FileEntry.path if scope == 'path' else FileEntry.name
+    query = db.select(FileEntry.id, FileEntry.name, FileEntry.parent, FileEntry.is_dir,
+                      FileEntry.total_size, FileEntry.mtime, FileEntry.file_type, FileEntry.file_count)
+    
+    order_column = FileEntry.id
+    if keyword and SEARCH_FTS_ENABLED and len(keyword) >= 3:
+        # trigram 分词至少需要 3 个字符；关键词整体作为短语，避免被解析成 FTS 查询语法。
+        # 以全文索引驱动查询并按其 rowid 排序：FTS5 按 rowid 顺序产出结果，取满一页即可停止
+        phrase = '"' + keyword.replace('"', '""') + '"'
+        query = (db.select(*query.selected_columns).select_from(_file_entry_fts)
+                 .join(FileEntry, FileEntry.id == _file_entry_fts.c.rowid)
+                 .where(db.text('file_entry_fts MATCH :match'))
+                 .params(match=f"{'path' if scope == 'path' else 'name'} : {phrase}"))
+        order_column = _file_entry_fts.c.rowid
+    elif keyword:
+        escaped = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.where(column.like(f'%{escaped}%', escape='\\'))
+    
+    query = query.where(FileEntry.path != '')
+    if file_types:
+        query = query.where(FileEntry.file_type.in_(file_types))
+    if under:
+        query = query.where(_index_subtree_clause(under))
+    if min_size is not None:
+        query = query.where(FileEntry.total_size >= min_size)
+    if max_size is not None:
+        query = query.where(FileEntry.total_size <= max_size)
+    if mtime_from is not None:
+        query = query.where(FileEntry.mtime >= mtime_from)
+    if mtime_to is not None:
+        query = query.where(FileEntry.mtime <= mtime_to)
+    
+    rows = db.session.execute(query.where(order_column > after_id).order_by(order_column).limit(limit + 1)).all()
+    files = [dict(make_file_item(r.name, r.is_dir, r.total_size, r.mtime, r.parent, r.file_type,
+                                 r.file_count if r.is_dir else None), parent=r.parent)
+             for r in rows[:limit]]
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return files, next_cursor
+
+# --- 辅助函数：上传后处理流水线 ---
+# 上传、粘贴、解压完成后登记 ingest_task，由固定数量的后台线程依次执行：
+# 内容哈希 -> 缩略图预生成 -> 图片/Office 元数据 -> 写回索引。
+# 队列保存在数据库中，请求线程只插入一行就返回；大批量上传时任务在表中排队，
+# 线程池按自身速度领取（背压），内存占用不随积压增长，进程重启后继续处理未完成的任务
+app.config['INGEST_WORKERS'] = min(4, os.cpu_count() or 1)  # 后处理线程数
+INGEST_MAX_ATTEMPTS = 3       # 单个任务最多尝试次数，超过后标记为 failed
+INGEST_POLL_INTERVAL = 30     # 空闲时轮询队列的间隔（秒），新任务登记时会立即唤醒
+INGEST_BATCH_SIZE = 500       # 展开目录任务时每批插入的任务数
+INGEST_THUMBNAIL_PRESETS = ('small', 'medium')  # 预生成的缩略图尺寸：列表视图和网格视图
+_ingest_wakeup = threading.Event()
+
+def file_sha256(abs_path, chunk_size=1024 * 1024):
+    """分块计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(abs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def extract_media_meta(abs_path):
+    """读取图片尺寸或 Office 文档属性，只解析文件头和文档结构，不渲染内容；不支持的类型返回 None"""
+    ext = os.path.splitext(abs_path.lower())[1]
+    if is_image(abs_path) and ext != '.svg':
+        with Image.open(abs_path) as img:
+            return {'width': img.width, 'height': img.height, 'format': img.format,
+                    'orientation': img.getexif().get(0x0112, 1)}
+    if ext == '.docx':
+        from docx import Document
+        doc = Document(abs_path)
+        props = doc.core_properties
+        return {'title': props.title, 'author': props.author,
+                'paragraphs': len(doc.paragraphs), 'tables': len(doc.tables)}
+    if ext == '.xlsx':
+        from openpyxl import load_workbook
+        wb = load_workbook(abs_path, read_only=True)
+        try:
+            return {'title': wb.properties.title, 'author': wb.properties.creator, 'sheets': wb.sheetnames}
+        finally:
+            wb.close()
+    if ext == '.pptx':
+        from pptx import Presentation
+        prs = Presentation(abs_path)
+        props = prs.core_properties
+        return {'title': props.title, 'author': props.author, 'slides': len(prs.slides)}
+    return None
+
+def enqueue_ingest(abs_path):
+    """登记后处理任务（文件或目录，目录由后台线程展开）；登记失败只记录日志，不影响文件操作本身"""
+    enqueue_ingest_many([abs_path])
+
+def enqueue_ingest_many(abs_paths):
+    """批量登记后处理任务，已在排队的路径不重复登记"""
+    try:
+        rels = list(dict.fromkeys(index_rel_path(abs_path) for abs_path in abs_paths))
+        for start in range(0, len(rels), INGEST_BATCH_SIZE):
+            batch = rels[start:start + INGEST_BATCH_SIZE]
+            queued = set(db.session.execute(
+                db.select(IngestTask.path).where(IngestTask.path.in_(batch), IngestTask.status == 'pending')).scalars())
+            new_tasks = [{'path': rel} for rel in batch if rel not in queued]
+            if new_tasks:
+                db.session.execute(db.insert(IngestTask), new_tasks)
+        db.session.commit()
+        _ingest_wakeup.set()
+    except Exception as e:
+        db.session.rollback()
+        print(f"登记后处理任务失败: {e}")
+
+def _ingest_expand_dir(abs_dir):
+    """目录任务展开为其下每个文件的任务，分批写入"""
+    batch = []
+    for dirpath, dirnames, filenames in os.walk(abs_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for name in filenames:
+            if name.startswith('.'): continue # 隐藏文件不入索引
+            batch.append({'path': index_rel_path(os.path.join(dirpath, name)), 'status': 'pending',
+                          'attempts': 0, 'created_at': datetime.now()})
+            if len(batch) >= INGEST_BATCH_SIZE:
+                db.session.execute(db.insert(IngestTask), batch)
+                db.session.commit()
+                batch = []
+    if batch:
+        db.session.execute(db.insert(IngestTask), batch)
+        db.session.commit()
+    _ingest_wakeup.set()
+
+def run_ingest_task(rel):
+    """执行单个后处理任务；文件在处理期间被修改或删除时放弃写回，由新的任务重新处理"""
+    abs_path = _index_abs_path(rel)
+    if os.path.isdir(abs_path):
+        _ingest_expand_dir(abs_path)
+        return
+    if not os.path.isfile(abs_path):
+        return
+    st = os.stat(abs_path)
+    
+    # 索引更新阶段需要条目存在；写操作钩子失败时在这里补上
+    query = db.select(FileEntry.size, FileEntry.mtime, FileEntry.content_hash).filter_by(path=rel)
+    entry = db.session.execute(query).first()
+    if entry is None:
+        index_update_path(abs_path)
+        entry = db.session.execute(query).first()
+    db.session.commit()
+    # 移动后的文件内容未变，哈希和元数据随索引条目保留，只需补生成新路径下的缩略图
+    analyzed = entry is not None and entry.content_hash is not None and \
+        (entry.size, entry.mtime) == (st.st_size, st.st_mtime)
+    
+    content_hash = None if analyzed else file_sha256(abs_path)
+    
+    if is_image(abs_path) and not abs_path.lower().endswith('.svg'):
+        fmt = 'WEBP' if THUMBNAIL_WEBP_SUPPORTED else 'JPEG'
+        try:
+            for preset in INGEST_THUMBNAIL_PRESETS:
+                get_cached_thumbnail(abs_path, THUMBNAIL_PRESETS[preset], fmt)
+        except Exception as e:
+            # 损坏或不支持的图片重试也无法成功，不影响其余阶段
+            print(f"预生成缩略图失败 {rel}: {e}")
+    
+    if analyzed:
+        return
+    try:
+        media_meta = extract_media_meta(abs_path)
+    except Exception as e:
+        print(f"读取文件元数据失败 {rel}: {e}")
+        media_meta = None
+    
+    with _index_lock:
+        db.session.execute(
+            db.update(FileEntry)
+            .where(FileEntry.path == rel, FileEntry.size == st.st_size, FileEntry.mtime == st.st_mtime)
+            .values(content_hash=content_hash,
+                    media_meta=json.dumps(media_meta, ensure_ascii=False) if media_meta else None)
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+
+def _ingest_claim():
+    """领取最早的待处理任务；按状态条件更新，多个线程（或进程）不会领到同一个任务"""
+    while True:
+        task = db.session.execute(
+            db.select(IngestTask.id, IngestTask.path, IngestTask.attempts)
+            .filter_by(status='pending').order_by(IngestTask.id).limit(1)).first()
+        if task is None:
+            db.session.commit()
+            return None
+        claimed = db.session.execute(
+            db.update(IngestTask)
+            .where(IngestTask.id == task.id, IngestTask.status == 'pending')
+            .values(status='running', attempts=IngestTask.attempts + 1)
+            .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if claimed:
+            return task
+
+def _ingest_worker():
+    while True:
+        _ingest_wakeup.clear()
+        with app.app_context():
+            try:
+                task = _ingest_claim()
+            except Exception as e:
+                db.session.rollback()
+                print(f"领取后处理任务失败: {e}")
+                task = None
+            if task is None:
+                _ingest_wakeup.wait(INGEST_POLL_INTERVAL)
+                continue
+            
+            try:
+                run_ingest_task(task.path)
+                db.session.execute(db.delete(IngestTask).where(IngestTask.id == task.id))
+            except Exception as e:
+                db.session.rollback()
+                print(f"后处理任务失败 {task.path}: {e}")
+                failed = task.attempts + 1 >= INGEST_MAX_ATTEMPTS
+                db.session.execute(
+                    db.update(IngestTask).where(IngestTask.id == task.id)
+                    .values(status='failed' if failed else 'pending', error=str(e)))
+            db.session.commit()
+
+def start_ingest_workers():
+    """启动后处理线程池；上次退出时仍在执行的任务重新放回队列"""
+    with app.app_context():
+        try:
+            db.session.execute(db.update(IngestTask).filter_by(status='running').values(status='pending'))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"恢复后处理队列失败: {e}")
+    for _ in range(app.config['INGEST_WORKERS']):
+        threading.Thread(target=_ingest_worker, daemon=True).start()
+
+# --- 辅助函数：后台任务 ---
+# 复制/移动、删除、解压和预先打包这类耗时操作登记为 job 表中的任务后立即返回任务 ID，
+# 由每个进程中的任务线程领取执行，不再占用请求线程，也不会被反向代理的超时打断。
+# 执行期间进度（字节数/文件数）每秒写回数据库一次，同时读取取消标记；
+# 进度可通过 /api/jobs/<id> 查询，或由 /api/jobs/<id>/events 以 Server-Sent Events 推送
+app.config['JOB_WORKERS'] = 2  # 每个进程执行后台任务的线程数
+JOB_POLL_INTERVAL = 5          # 空闲时轮询任务表的间隔（秒），本进程登记任务时会立即唤醒
+JOB_FLUSH_INTERVAL = 1.0       # 进度写回数据库、检查取消标记的间隔（秒）
+JOB_STALE_AFTER = 300          # 运行中的任务超过这个时间（秒）没有心跳，视为所在进程已退出
+JOB_RETENTION = 7 * 24 * 3600  # 已结束的任务保留时间（秒）
+JOB_EVENTS_INTERVAL = 0.5      # 进度推送的检查间隔（秒）；任务在本进程执行时直接读取内存中的进度
+JOB_EVENTS_MAX_INTERVAL = 5    # 任务在其他进程执行时读数据库，进度没有变化则逐步放慢到这个间隔
+JOB_EVENTS_KEEPALIVE = 15      # 这么久（秒）没有推送时发送注释行，防止代理断开连接
+JOB_HANDLERS = {}              # 任务类型 -> 执行函数 (progress, params) -> 结果
+_job_wakeup = threading.Event()
+_jobs_running = {}             # 本进程正在执行的任务 ID -> JobProgress
+_jobs_running_lock = threading.Lock()
+
+class JobCancelled(Exception):
+    """任务被用户取消；result 为取消前已完成部分的结果，随取消状态一起记录"""
+    
+    def __init__(self, result=None):
+        super().__init__()
+        self.result = result
+
+class JobProgress:
+    """任务的执行进度；任务线程及其使用的线程池都可以更新，定期写回数据库"""
+    
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.total_bytes = None
+        self.total_files = None
+        self.done_bytes = 0
+        self.done_files = 0
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushed_at = 0
+    
+    def set_total(self, files=None, nbytes=None):
+        with self._lock:
+            self.total_files = files
+            self.total_bytes = nbytes
+        self.check(force=True)
+    
+    def advance(self, nbytes=0, files=0):
+        with self._lock:
+            self.done_bytes += nbytes
+            self.done_files += files
+        self.check()
+    
+    def check(self, force=False):
+        """到达刷新间隔时写回进度并读取取消标记；任务已取消时抛出 JobCancelled"""
+        if (force or time.monotonic() - self._flushed_at >= JOB_FLUSH_INTERVAL) and \
+                self._flush_lock.acquire(blocking=False):
+            try:
+                self._flushed_at = time.monotonic()
+                self.flush()
+            finally:
+                self._flush_lock.release()
+        if self.cancelled:
+            raise JobCancelled()
+    
+    def snapshot(self):
+        with self._lock:
+            return {'total_bytes': self.total_bytes, 'done_bytes': self.done_bytes,
+                    'total_files': self.total_files, 'done_files': self.done_files}
+    
+    def flush(self):
+        values = self.snapshot()
+        # 可能在线程池中调用，使用独立的应用上下文（数据库会话）
+        with app.app_context():
+            try:
+                db.session.execute(db.update(Job).where(Job.id == self.job_id)
+                                   .values(updated_at=datetime.now(), **values))
+                if db.session.execute(db.select(Job.cancel_requested).filter_by(id=self.job_id)).scalar():
+                    self.cancelled = True
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"更新任务进度失败 {self.job_id}: {e}")
+
+def job_handler(kind):
+    """注册任务类型的执行函数"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+def submit_job(kind, params):
+    """登记任务并唤醒本进程的任务线程，返回任务 ID"""
+    job = Job(id=uuid.uuid4().hex, kind=kind, params=json.dumps(params, ensure_ascii=False))
+    db.session.add(job)
+    db.session.commit()
+    _job_wakeup.set()
+    return job.id
+
+def cancel_job(job_id):
+    """取消任务：排队中的直接标记为已取消，执行中的设置取消标记，由任务在下次检查时停止"""
+    now = datetime.now()
+    db.session.execute(db.update(Job).where(Job.id == job_id, Job.status == 'pending')
+                       .values(status='cancelled', finished_at=now, updated_at=now))
+    db.session.execute(db.update(Job).where(Job.id == job_id, Job.status == 'running')
+                       .values(cancel_requested=True))
+    db.session.commit()
+    with _jobs_running_lock:
+        progress = _jobs_running.get(job_id)
+    if progress:
+        progress.cancelled = True
+
+def job_status(job, progress=None):
+    """任务状态的 JSON 表示，运行中的任务按已完成的比例估算剩余时间；
+    progress 为本进程中执行该任务的 JobProgress 时，使用内存中的最新进度代替数据库中的值"""
+    counts = progress.snapshot() if progress else {
+        'total_bytes': job.total_bytes, 'done_bytes': job.done_bytes,
+        'total_files': job.total_files, 'done_files': job.done_files}
+    eta = None
+    if job.status == 'running' and job.started_at:
+        elapsed = (datetime.now() - job.started_at).total_seconds()
+        if counts['total_bytes'] and counts['done_bytes']:
+            eta = elapsed * (counts['total_bytes'] - counts['done_bytes']) / counts['done_bytes']
+        elif counts['total_files'] and counts['done_files']:
+            eta = elapsed * (counts['total_files'] - counts['done_files']) / counts['done_files']
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        **counts,
+        'eta': round(eta, 1) if eta is not None else None,
+        'cancel_requested': job.cancel_requested or bool(progress and progress.cancelled),
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None,
+    }
+
+def _job_claim():
+    """领取最早的待执行任务；按状态条件更新，多个线程（或进程）不会领到同一个任务"""
+    while True:
+        job = db.session.execute(
+            db.select(Job.id, Job.kind, Job.params)
+            .filter_by(status='pending').order_by(Job.created_at).limit(1)).first()
+        if job is None:
+            db.session.commit()
+            return None
+        now = datetime.now()
+        claimed = db.session.execute(
+            db.update(Job)
+            .where(Job.id == job.id, Job.status == 'pending')
+            .values(status='running', started_at=now, updated_at=now)
+            .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if claimed:
+            return job
+
+def _job_worker():
+    while True:
+        _job_wakeup.clear()
+        with app.app_context():
+            try:
+                job = _job_claim()
+            except Exception as e:
+                db.session.rollback()
+                print(f"领取后台任务失败: {e}")
+                job = None
+            if job is None:
+                _job_wakeup.wait(JOB_POLL_INTERVAL)
+                continue
+            
+            progress = JobProgress(job.id)
+            with _jobs_running_lock:
+                _jobs_running[job.id] = progress
+            result = error = None
+            try:
+                result = JOB_HANDLERS[job.kind](progress, json.loads(job.params))
+                status = 'done'
+            except JobCancelled as e:
+                status, result = 'cancelled', e.result
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                status, error = 'failed', str(e)
+            finally:
+                with _jobs_running_lock:
+                    _jobs_running.pop(job.id, None)
+            
+            db.session.rollback()
+            now = datetime.now()
+            db.session.execute(
+                db.update(Job).where(Job.id == job.id)
+                .values(status=status, error=error, finished_at=now, updated_at=now,
+                        result=json.dumps(result, ensure_ascii=False) if result is not None else None,
+                        total_bytes=progress.total_bytes, done_bytes=progress.done_bytes,
+                        total_files=progress.total_files, done_files=progress.done_files))
+            db.session.commit()
+
+def _job_heartbeat():
+    """定期刷新本进程正在执行的任务的心跳；整体解压 RAR/7Z 这类长时间没有进度的任务也不会被当作已中断"""
+    while True:
+        time.sleep(JOB_STALE_AFTER / 5)
+        with _jobs_running_lock:
+            job_ids = list(_jobs_running)
+        if not job_ids:
+            continue
+        with app.app_context():
+            try:
+                db.session.execute(db.update(Job).where(Job.id.in_(job_ids), Job.status == 'running')
+                                   .values(updated_at=datetime.now()))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"刷新任务心跳失败: {e}")
+
+def start_job_workers():
+    """启动本进程的任务线程（每个工作进程都会执行任务，谁登记的任务通常由谁立即领取）"""
+    for _ in range(app.config['JOB_WORKERS']):
+        threading.Thread(target=_job_worker, daemon=True).start()
+    threading.Thread(target=_job_heartbeat, daemon=True).start()
+
+def cleanup_jobs():
+    """把心跳超时的运行中任务标记为失败（所在进程已退出），删除过期的已结束任务"""
+    with app.app_context():
+        try:
+            now = datetime.now()
+            db.session.execute(
+                db.update(Job)
+                .where(Job.status == 'running', Job.updated_at < now - timedelta(seconds=JOB_STALE_AFTER))
+                .values(status='failed', error='执行任务的进程已退出', finished_at=now))
+            db.session.execute(
+                db.delete(Job)
+                .where(Job.status.in_(('done', 'failed', 'cancelled')),
+                       Job.finished_at < now - timedelta(seconds=JOB_RETENTION)))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"清理后台任务失败: {e}")
+
+def copy_file_with_progress(progress):
+    """返回按块复制单个文件并汇报进度的复制函数，可作为 copytree/move 的 copy_function"""
+    def copy(src, dst, *, follow_symlinks=True):
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            while True:
+                data = fsrc.read(1024 * 1024)
+                if not data:
+                    break
+                fdst.write(data)
+                progress.advance(len(data))
+        shutil.copystat(src, dst, follow_symlinks=follow_symlinks)
+        progress.advance(files=1)
+        return dst
+    return copy
+
+def count_tree(abs_paths):
+    """统计多个文件/目录包含的 (文件数, 总字节数)"""
+    files = total = 0
+    for abs_path in abs_paths:
+        if os.path.isdir(abs_path):
+            for root, _, names in os.walk(abs_path):
+                for name in names:
+                    try:
+                        total += os.lstat(os.path.join(root, name)).st_size
+                    except OSError:
+                        continue
+                    files += 1
+        elif os.path.exists(abs_path):
+            files += 1
+            total += os.path.getsize(abs_path)
+    return files, total
+
+# --- 辅助函数：目录列表排序与分页 ---
+LIST_PAGE_SIZE = 200   # 首屏及每页返回的条目数
+LIST_PAGE_MAX = 1000   # 单页允许请求的最大条目数
+
+def _list_sort_key(item, sort_by):
+    """排序键：文件夹在前，其次按排序字段，最后按原始名称保证顺序稳定"""
+    if sort_by == 'time':
+        primary = item['mtime_timestamp']
+    elif sort_by == 'size':
+        primary = item['size_bytes']
+    else:
+        primary = item['name'].lower()
+    return (not item['is_dir'], primary, item['name'])
+
+def sort_files(files_list, sort_by, sort_order):
+    files_list.sort(key=lambda x: _list_sort_key(x, sort_by))
+    
+    # 倒序：文件夹和文件分别倒序，文件夹仍然排在前面
+    if sort_order == 'desc':
+        folders = [f for f in files_list if f['is_dir']]
+        files = [f for f in files_list if not f['is_dir']]
+        folders.reverse()
+        files.reverse()
+        files_list = folders + files
+    return files_list
+
+def encode_list_cursor(item, sort_by, sort_order):
+    """游标记录上一页最后一个条目的排序键，目录内容变化时翻页位置依然稳定"""
+    payload = {'s': sort_by, 'o': sort_order, 'k': list(_list_sort_key(item, sort_by))}
+    return base64.urlsafe_b64encode(json.dumps(payload, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+def paginate_files(files_list, sort_by, sort_order, cursor=None, limit=LIST_PAGE_SIZE):
+    """从已排序的列表中取出游标之后的一页，返回 (本页条目, 下一页游标)"""
+    start = 0
+    if cursor:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            if payload['s'] != sort_by or payload['o'] != sort_order:
+                raise ValueError("游标与排序方式不匹配")
+            cursor_key = tuple(payload['k'])
+            
+            def is_after(item):
+                key = _list_sort_key(item, sort_by)
+                if key[0] != cursor_key[0]:
+                    return key[0] > cursor_key[0]
+                if sort_order == 'desc':
+                    return key[1:] < cursor_key[1:]
+                return key[1:] > cursor_key[1:]
+            
+            start = next((i for i, item in enumerate(files_list) if is_after(item)), len(files_list))
+        except Exception:
+            raise ValueError("无效的游标")
+    
+    page = files_list[start:start + limit]
+    next_cursor = None
+    if start + limit < len(files_list) and page:
+        next_cursor = encode_list_cursor(page[-1], sort_by, sort_order)
+    return page, next_cursor
+
+def directory_etag(abs_path, *parts):
+    """由目录 inode 和 mtime 生成 ETag，目录内条目增删改名都会改变 mtime"""
+    st = os.stat(abs_path)
+    raw = '|'.join([str(st.st_ino), str(st.st_mtime_ns)] + [str(p) for p in parts])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
 
 # --- 路由：登录页面 ---
 @app.route('/login', methods=['GET', 'POST'])
@@ -549,46 +2071,12 @@ def index():
 
     files_list = []
     if os.path.isdir(abs_path):
-        for item in os.listdir(abs_path):
-            if item.startswith('.'): continue # 隐藏文件
-            full_item_path = os.path.join(abs_path, item)
-            is_dir = os.path.isdir(full_item_path)
-            size = os.path.getsize(full_item_path) if not is_dir else 0
-            size_bytes = size  # 保存原始字节数用于排序
-            mtime_timestamp = os.path.getmtime(full_item_path)  # 保存时间戳用于排序
-            # 转换时间
-            mtime = time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime_timestamp))
-            
-            rel_path_item = os.path.join(req_path, item).replace('\\', '/')
-            
-            files_list.append({
-                'name': item,
-                'is_dir': is_dir,
-                'size': f"{size/1024/1024:.2f} MB" if not is_dir else "-",
-                'size_bytes': size_bytes,
-                'mtime': mtime,
-                'mtime_timestamp': mtime_timestamp,
-                'rel_path': rel_path_item,
-                'file_type': 'folder' if is_dir else get_file_type(item)
-            })
-    
-    # 排序逻辑
-    if sort_by == 'name':
-        files_list.sort(key=lambda x: (not x['is_dir'], x['name'].lower()))
-    elif sort_by == 'time':
-        files_list.sort(key=lambda x: (not x['is_dir'], x['mtime_timestamp']))
-    elif sort_by == 'size':
-        files_list.sort(key=lambda x: (not x['is_dir'], x['size_bytes']))
+        files_list = list_directory_items(abs_path, req_path)
     
-    # 倒序
-    if sort_order == 'desc':
-        # 分离文件夹和文件
-        folders = [f for f in files_list if f['is_dir']]
-        files = [f for f in files_list if not f['is_dir']]
-        # 分别倒序
-        folders.reverse()
-        files.reverse()
-        files_list = folders + files
+    # 排序后只渲染首屏，其余条目由前端通过 /api/list 按需加载
+    total_count = len(files_list)
+    files_list = sort_files(files_list, sort_by, sort_order)
+    files_list, next_cursor = paginate_files(files_list, sort_by, sort_order)
     
     # 获取主题和背景设置
     theme = get_setting('theme', 'light')
@@ -598,6 +2086,8 @@ def index():
     
     return render_template('index.html', 
                          files=files_list, 
+                         next_cursor=next_cursor,
+                         total_count=total_count,
                          current_path=req_path,
                          sort_by=sort_by,
                          sort_order=sort_order,
@@ -610,6 +2100,98 @@ def index():
                          github_url=GITHUB_URL,
                          bilibili_url=BILIBILI_URL)
 
+# --- 接口：分页获取目录列表 ---
+@app.route('/api/list')
+@login_required
+def list_directory():
+    req_path = request.args.get('path', '')
+    sort_by = request.args.get('sort', 'name')  # name, time, size
+    sort_order = request.args.get('order', 'asc')  # asc, desc
+    cursor = request.args.get('cursor', '')
+    file_type = request.args.get('type', '')  # 按类型过滤：folder, image, video ...
+    try:
+        limit = min(max(int(request.args.get('limit', LIST_PAGE_SIZE)), 1), LIST_PAGE_MAX)
+    except ValueError:
+        limit = LIST_PAGE_SIZE
+    
+    try:
+        abs_path = get_safe_path(req_path)
+    except ValueError:
+        return jsonify({'status': 'error', 'msg': '非法路径'}), 403
+    
+    if not os.path.isdir(abs_path):
+        return jsonify({'status': 'error', 'msg': '目录不存在'}), 404
+    
+    # 先按需同步索引，ETag 才与本次返回的内容一致
+    try:
+        index_refresh_dir(abs_path)
+    except Exception as e:
+        db.session.rollback()
+        print(f"同步文件索引失败: {e}")
+    
+    # 目录未变化时直接返回 304，无需重新读取列表
+    etag = directory_etag(abs_path, sort_by, sort_order, cursor, limit, file_type,
+                          index_folder_totals(abs_path))
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    
+    files_list = sort_files(list_directory_items(abs_path, req_path, file_type), sort_by, sort_order)
+    try:
+        page, next_cursor = paginate_files(files_list, sort_by, sort_order, cursor, limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'msg': str(e)}), 400
+    
+    response = jsonify({
+        'status': 'success',
+        'files': page,
+        'next_cursor': next_cursor,
+        'total': len(files_list)
+    })
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# --- 接口：搜索文件 ---
+@app.route('/api/search')
+@login_required
+def search_files():
+    keyword = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'name')  # name: 只匹配文件名, path: 匹配完整相对路径
+    file_types = [t for t in request.args.get('type', '').split(',') if t]
+    try:
+        under = index_rel_path(get_safe_path(request.args.get('path', '')))
+    except ValueError:
+        return jsonify({'status': 'error', 'msg': '非法路径'}), 403
+    
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_PAGE_SIZE)), 1), LIST_PAGE_MAX)
+        after_id = int(request.args.get('cursor') or 0)
+        min_size = int(request.args['min_size']) if request.args.get('min_size') else None
+        max_size = int(request.args['max_size']) if request.args.get('max_size') else None
+        mtime_from = parse_search_time(request.args['mtime_from']) if request.args.get('mtime_from') else None
+        mtime_to = parse_search_time(request.args['mtime_to']) if request.args.get('mtime_to') else None
+    except ValueError:
+        return jsonify({'status': 'error', 'msg': '搜索参数格式错误'}), 400
+    
+    if not keyword and not file_types:
+        return jsonify({'status': 'error', 'msg': '请输入搜索关键词'}), 400
+    
+    try:
+        files, next_cursor = search_file_index(keyword, scope, file_types, under, min_size, max_size,
+                                               mtime_from, mtime_to, after_id, limit)
+    except Exception as e:
+        db.session.rollback()
+        print(f"搜索失败: {e}")
+        return jsonify({'status': 'error', 'msg': '搜索失败'}), 500
+    
+    return jsonify({
+        'status': 'success',
+        'files': files,
+        'next_cursor': next_cursor
+    })
+
 # --- 接口：操作 (重命名, 删除, 新建文件夹) ---
 @app.route('/api/operate', methods=['POST'])
 @login_required
@@ -636,12 +2218,14 @@ def operate():
                 return jsonify({'status': 'error', 'msg': f'文件夹 "{new_folder}" 已存在'})
             
             os.mkdir(new_folder_path)
+            index_update_path(new_folder_path)
             
         elif action == 'delete':
             if os.path.isdir(abs_path):
                 shutil.rmtree(abs_path)
             else:
                 os.remove(abs_path)
+            index_remove_path(abs_path)
                 
         elif action == 'rename':
             new_name = data.get('new_name')
@@ -658,6 +2242,7 @@ def operate():
                 return jsonify({'status': 'error', 'msg': f'名称 "{new_name}" 已存在'})
             
             os.rename(abs_path, new_path)
+            index_move_path(abs_path, new_path)
             
         return jsonify({'status': 'success'})
     except Exception as e:
@@ -665,6 +2250,152 @@ def operate():
         traceback.print_exc()
         return jsonify({'status': 'error', 'msg': str(e)})
 
+# --- 辅助函数：批量复制/移动 ---
+# 整个选择在一个请求中处理：目标目录只扫描一次，为各个条目分配不冲突的名称（_副本N），
+# 复制/移动在线程池中并行执行，索引更新在请求线程中依次完成，结果逐项汇总返回
+app.config['PASTE_WORKERS'] = 4  # 并行执行复制/移动的线程数（所有请求共用）
+_paste_pool = None
+_paste_pool_lock = threading.Lock()
+
+def _paste_get_pool():
+    global _paste_pool
+    with _paste_pool_lock:
+        if _paste_pool is None:
+            _paste_pool = ThreadPoolExecutor(max_workers=app.config['PASTE_WORKERS'])
+        return _paste_pool
+
+def plan_paste_names(abs_dest_folder, names):
+    """为各个名称分配目标文件名，与目标目录中已有的条目以及本批中先分配的名称都不冲突"""
+    taken = {os.path.normcase(name) for name in os.listdir(abs_dest_folder)}
+    planned = []
+    for filename in names:
+        final_name = filename
+        base_name, ext = os.path.splitext(filename)
+        counter = 1
+        while os.path.normcase(final_name) in taken:
+            final_name = f"{base_name}_副本{counter}{ext}"
+            counter += 1
+        taken.add(os.path.normcase(final_name))
+        planned.append(final_name)
+    return planned
+
+def _paste_one(action, abs_src, abs_dest_final, progress=None):
+    if progress is None:
+        if action == 'copy':
+            if os.path.isdir(abs_src):
+                shutil.copytree(abs_src, abs_dest_final)
+            else:
+                shutil.copy2(abs_src, abs_dest_final)
+        else:
+            shutil.move(abs_src, abs_dest_final)
+        return
+    
+    progress.check()
+    if action == 'move' and os.lstat(abs_src).st_dev == os.stat(os.path.dirname(abs_dest_final)).st_dev:
+        files, nbytes = count_tree([abs_src])
+        os.rename(abs_src, abs_dest_final)
+        try:
+            progress.advance(nbytes, files)
+        except JobCancelled:
+            pass # 已经完成的移动不回退，取消从下一项开始生效
+        return
+    
+    # 复制，或跨文件系统移动（先复制再删除源）：按块复制并汇报进度
+    copy = copy_file_with_progress(progress)
+    try:
+        if os.path.isdir(abs_src):
+            shutil.copytree(abs_src, abs_dest_final, symlinks=action == 'move', copy_function=copy)
+        else:
+            copy(abs_src, abs_dest_final)
+    except BaseException:
+        # 复制失败或任务被取消时不留下不完整的副本（目标名称是新分配的，不会误删已有内容）
+        if os.path.isdir(abs_dest_final):
+            shutil.rmtree(abs_dest_final, ignore_errors=True)
+        elif os.path.exists(abs_dest_final):
+            os.remove(abs_dest_final)
+        raise
+    if action == 'move':
+        if os.path.isdir(abs_src) and not os.path.islink(abs_src):
+            shutil.rmtree(abs_src)
+        else:
+            os.remove(abs_src)
+
+def paste_target(action, dest_path):
+    """检查粘贴操作和目标文件夹，返回目标文件夹的绝对路径"""
+    if action not in ('copy', 'move'):
+        raise ValueError('不支持的操作')
+    abs_dest_folder = get_safe_path(dest_path)
+    if not os.path.isdir(abs_dest_folder):
+        raise ValueError('目标文件夹不存在')
+    return abs_dest_folder
+
+def paste_items(action, src_paths, dest_path, progress=None):
+    """把 src_paths 复制（copy）或移动（move）到目标文件夹 dest_path，返回与 src_paths 一一对应的结果；
+    在后台任务中执行时传入 progress，汇报复制的字节数；任务取消时抛出 JobCancelled，其 result 为逐项结果"""
+    abs_dest_folder = paste_target(action, dest_path)
+    
+    results = [None] * len(src_paths)
+    items = []
+    for i, src_path in enumerate(src_paths):
+        try:
+            abs_src = get_safe_path(src_path)
+        except ValueError:
+            results[i] = {'src': src_path, 'status': 'error', 'msg': '非法路径'}
+            continue
+        if abs_src == STORAGE_DIR or not os.path.exists(abs_src):
+            results[i] = {'src': src_path, 'status': 'error', 'msg': '源文件不存在'}
+        elif os.path.isdir(abs_src) and (abs_dest_folder + os.sep).startswith(abs_src + os.sep):
+            results[i] = {'src': src_path, 'status': 'error', 'msg': '不能粘贴到自身或其子文件夹中'}
+        else:
+            items.append((i, abs_src))
+    
+    names = plan_paste_names(abs_dest_folder, [os.path.basename(abs_src) for _, abs_src in items])
+    if progress is not None:
+        progress.set_total(*count_tree([abs_src for _, abs_src in items]))
+    pool = _paste_get_pool()
+    futures = []
+    for (i, abs_src), name in zip(items, names):
+        abs_dest_final = os.path.join(abs_dest_folder, name)
+        futures.append((i, abs_src, abs_dest_final,
+                        pool.submit(_paste_one, action, abs_src, abs_dest_final, progress)))
+    
+    done = []
+    for i, abs_src, abs_dest_final, future in futures:
+        try:
+            future.result()
+        except JobCancelled:
+            results[i] = {'src': src_paths[i], 'status': 'error', 'msg': '已取消'}
+            continue
+        except Exception as e:
+            results[i] = {'src': src_paths[i], 'status': 'error', 'msg': f'操作失败: {str(e)}'}
+            continue
+        done.append((abs_src, abs_dest_final))
+        results[i] = {'src': src_paths[i], 'status': 'success', 'dest': get_rel_path(abs_dest_final)}
+    
+    if done:
+        if action == 'copy':
+            index_update_paths([abs_dest_final for _, abs_dest_final in done])
+        else:
+            index_move_paths(done)
+        # 移动时哈希和元数据随索引保留，只需生成新路径的缩略图
+        enqueue_ingest_many([abs_dest_final for _, abs_dest_final in done])
+    if progress is not None and progress.cancelled:
+        raise JobCancelled(results)
+    return results
+
+def _paste_job_result(results):
+    failed = sum(1 for result in results if result['status'] != 'success')
+    return {'results': results, 'succeeded': len(results) - failed, 'failed': failed}
+
+@job_handler('paste')
+def job_paste(progress, params):
+    try:
+        results = paste_items(params['action'], params['srcs'], params['dest'], progress)
+    except JobCancelled as e:
+        # 取消前已完成的条目不会回退，逐项结果随取消状态一起保存
+        raise JobCancelled(_paste_job_result(e.result) if e.result is not None else None)
+    return _paste_job_result(results)
+
 # --- 接口：复制/移动/粘贴 ---
 @app.route('/api/paste', methods=['POST'])
 @login_required
@@ -675,87 +2406,538 @@ def paste():
     action = data.get('action') # copy 或 move
 
     try:
-        abs_src = get_safe_path(src_path)
-        abs_dest_folder = get_safe_path(dest_path)
-        
-        # 检查源文件是否存在
-        if not os.path.exists(abs_src):
-            return jsonify({'status': 'error', 'msg': '源文件不存在'})
-        
-        # 检查目标文件夹是否存在
-        if not os.path.exists(abs_dest_folder):
-            return jsonify({'status': 'error', 'msg': '目标文件夹不存在'})
-        
-        filename = os.path.basename(abs_src)
-        abs_dest_final = os.path.join(abs_dest_folder, filename)
-        
-        # 如果目标已存在，自动重命名
-        if os.path.exists(abs_dest_final):
-            base_name, ext = os.path.splitext(filename)
-            counter = 1
-            while os.path.exists(abs_dest_final):
-                new_filename = f"{base_name}_副本{counter}{ext}"
-                abs_dest_final = os.path.join(abs_dest_folder, new_filename)
-                counter += 1
-
-        if action == 'copy':
-            if os.path.isdir(abs_src):
-                shutil.copytree(abs_src, abs_dest_final)
-            else:
-                shutil.copy2(abs_src, abs_dest_final)
-        elif action == 'move':
-            shutil.move(abs_src, abs_dest_final)
-            
-        return jsonify({'status': 'success'})
+        result = paste_items(action, [src_path], dest_path)[0]
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'msg': str(e)})
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'status': 'error', 'msg': f'操作失败: {str(e)}'})
 
+# --- 接口：批量复制/移动/粘贴 ---
+# 登记为后台任务后立即返回任务 ID，逐项结果在任务完成后的 result 中
+@app.route('/api/paste/batch', methods=['POST'])
+@login_required
+def paste_batch():
+    data = request.json or {}
+    src_paths = data.get('srcs') or []
+    if not isinstance(src_paths, list):
+        return jsonify({'status': 'error', 'msg': '参数无效'}), 400
+    
+    try:
+        paste_target(data.get('action'), data.get('dest'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'msg': str(e)})
+    job_id = submit_job('paste', {'action': data.get('action'), 'srcs': src_paths, 'dest': data.get('dest')})
+    return jsonify({'status': 'success', 'job_id': job_id})
+
+# --- 辅助函数：批量删除 ---
+def delete_tree(abs_path, progress):
+    """自底向上逐个删除文件并汇报进度；取消时停在当前位置，已删除的部分不恢复"""
+    if os.path.isdir(abs_path) and not os.path.islink(abs_path):
+        for root, dirs, files in os.walk(abs_path, topdown=False):
+            for name in files:
+                full_path = os.path.join(root, name)
+                size = os.lstat(full_path).st_size
+                os.remove(full_path)
+                progress.advance(size, 1)
+            for name in dirs:
+                full_path = os.path.join(root, name)
+                if os.path.islink(full_path):
+                    os.remove(full_path)
+                else:
+                    os.rmdir(full_path)
+        os.rmdir(abs_path)
+    else:
+        size = os.lstat(abs_path).st_size
+        os.remove(abs_path)
+        progress.advance(size, 1)
+
+@job_handler('delete')
+def job_delete(progress, params):
+    abs_paths = []
+    for path in params['paths']:
+        abs_path = get_safe_path(path)
+        if abs_path != STORAGE_DIR and os.path.lexists(abs_path):
+            abs_paths.append(abs_path)
+    progress.set_total(*count_tree(abs_paths))
+    
+    started = []
+    try:
+        for abs_path in abs_paths:
+            progress.check()
+            started.append(abs_path)
+            delete_tree(abs_path, progress)
+    finally:
+        # 删到一半（出错或取消）的文件夹按磁盘上剩下的内容重新同步索引
+        for abs_path in started:
+            if os.path.lexists(abs_path):
+                index_update_path(abs_path)
+            else:
+                index_remove_path(abs_path)
+    return {'deleted': len(abs_paths)}
+
+# --- 接口：批量删除 ---
+@app.route('/api/delete/batch', methods=['POST'])
+@login_required
+def delete_batch():
+    data = request.json or {}
+    paths = data.get('paths') or []
+    if not isinstance(paths, list) or not paths:
+        return jsonify({'status': 'error', 'msg': '参数无效'}), 400
+    try:
+        for path in paths:
+            if get_safe_path(path) == STORAGE_DIR:
+                return jsonify({'status': 'error', 'msg': '不能删除根目录'})
+    except ValueError:
+        return jsonify({'status': 'error', 'msg': '非法路径'})
+    job_id = submit_job('delete', {'paths': paths})
+    return jsonify({'status': 'success', 'job_id': job_id})
+
+# --- 辅助函数：上传文件名与目标路径 ---
+def safe_filename(filename):
+    """安全的文件名处理（保留中文）：只移除危险字符"""
+    dangerous_chars = ['..', '/', '\\', '\0', '<', '>', ':', '"', '|', '?', '*']
+    for char in dangerous_chars:
+        filename = filename.replace(char, '_')
+    return filename.strip()
+
+def upload_dest_path(save_dir, filename, relative_path=''):
+    """计算上传文件的目标路径；有相对路径（文件夹上传）时保持目录结构，并创建所需的子目录"""
+    if relative_path and '/' in relative_path:
+        path_parts = relative_path.split('/')
+        # 创建子目录（保留中文目录名）
+        safe_parts = [safe_filename(part) for part in path_parts[:-1]]
+        sub_dir = os.path.join(save_dir, *safe_parts)
+        os.makedirs(sub_dir, exist_ok=True)
+        return os.path.join(sub_dir, safe_filename(path_parts[-1]))
+    return os.path.join(save_dir, safe_filename(filename))
+
+# --- 辅助函数：流式接收上传 ---
+# Werkzeug 的表单解析会把超过 500KB 的文件先写入系统临时目录，file.save() 再复制到 storage，
+# 每个字节写两遍，而且通常跨文件系统。这里自行按块解析 multipart 请求体，
+# 文件数据边收边写入上传目录下的隐藏临时文件，接收完成后原子重命名为目标文件
+UPLOAD_READ_SIZE = 1024 * 1024    # 每次从请求体读取的字节数
+UPLOAD_FIELD_MAX = 64 * 1024      # 普通表单字段的最大长度
+
+def receive_multipart_upload(file_field='file'):
+    """解析当前请求的 multipart 表单，返回 (表单字段, [(临时文件路径, 原文件名)])
+    
+    文件写在 path 字段指定的目录（path 在文件之前发送时）下，由调用方重命名到最终位置；
+    解析失败时已写入的临时文件会被删除。
+    """
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError('请求格式错误')
+    
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    fields = {}
+    received = []
+    part, value, out = None, [], None
+    completed = False
+    try:
+        while not completed:
+            data = request.stream.read(UPLOAD_READ_SIZE)
+            decoder.receive_data(data or None)
+            event = decoder.next_event()
+            while not isinstance(event, NeedData):
+                if isinstance(event, Epilogue):
+                    completed = True
+                    break
+                if isinstance(event, File) and event.name == file_field:
+                    part = event
+                    fd, tmp_path = tempfile.mkstemp(prefix='.', suffix=UPLOAD_STAGING_SUFFIX,
+                                                    dir=get_safe_path(fields.get('path', '')))
+                    out = os.fdopen(fd, 'wb')
+                    received.append((tmp_path, event.filename))
+                elif isinstance(event, (Field, File)):
+                    part, value = event, []
+                elif isinstance(event, Data):
+                    if out:
+                        out.write(event.data)
+                        if not event.more_data:
+                            out.close()
+                            out = None
+                    elif isinstance(part, Field):
+                        value.append(event.data)
+                        if sum(map(len, value)) > UPLOAD_FIELD_MAX:
+                            raise ValueError('表单字段过长')
+                        if not event.more_data:
+                            fields[part.name] = b''.join(value).decode('utf-8', 'replace')
+                event = decoder.next_event()
+            if not data and not completed:
+                raise ValueError('上传数据不完整')
+    except BaseException:
+        if out:
+            out.close()
+        for tmp_path, _ in received:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        raise
+    return fields, received
+
 # --- 接口：上传文件 ---
 @app.route('/upload', methods=['POST'])
 @login_required
-def upload():
-    current_path = request.form.get('path', '')
-    file = request.files.get('file')
-    relative_path = request.form.get('relativePath', '')
+def upload():
+    received = []
+    try:
+        fields, received = receive_multipart_upload()
+        save_dir = get_safe_path(fields.get('path', ''))
+        
+        for tmp_path, filename in received:
+            dest_path = upload_dest_path(save_dir, filename, fields.get('relativePath', ''))
+            os.replace(tmp_path, dest_path)
+            index_update_path(dest_path)
+            enqueue_ingest(dest_path)
+                
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        for tmp_path, _ in received:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        import traceback
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'msg': str(e)})
+
+# --- 辅助函数：批量上传小文件 ---
+# 文件夹上传时浏览器把小文件打成一个 tar 流（不压缩）在单个请求中发送，服务器边读边解包，
+# 省去每个文件一次请求的开销。路径按与 upload() 相同的规则处理，已创建的目录只创建一次，
+# 索引和后处理按顶层条目登记（目录由同步和后台线程展开），而不是每个文件提交一次数据库
+def receive_tar_upload(stream, save_dir, top_level):
+    """把 tar 流中的普通文件解包到 save_dir，返回 (文件数, 字节数)；写入的顶层条目加入 top_level（中途失败时也包含已写入的部分）"""
+    import tarfile
+    created_dirs = set()
+    file_count = total_bytes = 0
+    with tarfile.open(fileobj=stream, mode='r|') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue  # 目录在写入文件时按需创建，链接和设备文件一律忽略
+            parts = [safe_filename(part) for part in member.name.split('/') if part not in ('', '.')]
+            if not parts or not all(parts):
+                continue
+            sub_dir = os.path.join(save_dir, *parts[:-1])
+            if sub_dir not in created_dirs:
+                os.makedirs(sub_dir, exist_ok=True)
+                created_dirs.add(sub_dir)
+            dest_path = os.path.join(sub_dir, parts[-1])
+            # 暂存文件名唯一，同时上传同一路径的两个请求不会写进同一个暂存文件
+            fd, tmp_path = tempfile.mkstemp(prefix='.', suffix=UPLOAD_STAGING_SUFFIX, dir=sub_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    shutil.copyfileobj(tar.extractfile(member), f, UPLOAD_READ_SIZE)
+                os.replace(tmp_path, dest_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            top_level.add(os.path.join(save_dir, parts[0]))
+            file_count += 1
+            total_bytes += member.size
+    return file_count, total_bytes
+
+# --- 接口：批量上传小文件 ---
+@app.route('/api/upload/bulk', methods=['POST'])
+@login_required
+def upload_bulk():
+    top_level = set()
+    try:
+        save_dir = get_safe_path(request.args.get('path', ''))
+        file_count, total_bytes = receive_tar_upload(request.stream, save_dir, top_level)
+        return jsonify({'status': 'success', 'files': file_count, 'bytes': total_bytes})
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'msg': str(e)})
+    finally:
+        # 中途失败时已解包的文件同样保留并登记，客户端重传时覆盖
+        for abs_path in top_level:
+            index_update_path(abs_path)
+            enqueue_ingest(abs_path)
+
+# --- 辅助函数：按内容哈希秒传 ---
+# 上传前浏览器先计算 SHA-256，服务器在索引中查找内容哈希和大小都相同的文件（哈希由后处理流水线计算），
+# 找到时直接在目标位置创建 reflink（写时复制，文件系统支持时）或硬链接，不传输任何数据
+app.config['UPLOAD_DEDUP_HARDLINK'] = True  # 不支持 reflink 时是否退回硬链接（同一内容的各个路径共享 inode）
+FICLONE = 0x40049409  # Linux ioctl：在 Btrfs/XFS 等文件系统上克隆文件数据
+
+def find_content(content_hash, size):
+    """返回索引中内容哈希和大小都匹配、且计算哈希之后未被修改的文件的 (绝对路径, 索引条目)"""
+    rows = db.session.execute(
+        db.select(FileEntry.path, FileEntry.mtime, FileEntry.media_meta)
+        .filter_by(content_hash=content_hash, size=size, is_dir=False).limit(16)).all()
+    for row in rows:
+        abs_path = _index_abs_path(row.path)
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            continue
+        if (st.st_size, st.st_mtime) == (size, row.mtime):
+            return abs_path, row
+    return None, None
+
+def _reflink(src, dest):
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+        fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+
+def link_duplicate(src, dest):
+    """在 dest 创建与 src 内容相同的文件而不复制数据；文件系统都不支持时返回 False"""
+    if os.path.exists(dest) and os.path.samefile(src, dest):
+        return True
+    fd, tmp_path = tempfile.mkstemp(prefix='.', suffix=UPLOAD_STAGING_SUFFIX, dir=os.path.dirname(dest))
+    os.close(fd)
+    try:
+        try:
+            _reflink(src, tmp_path)
+        except (OSError, ImportError):
+            if not app.config['UPLOAD_DEDUP_HARDLINK']:
+                return False
+            os.remove(tmp_path)
+            try:
+                os.link(src, tmp_path)
+            except OSError:
+                return False
+        os.replace(tmp_path, dest)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# --- 接口：秒传检查 ---
+@app.route('/api/upload/check', methods=['POST'])
+@login_required
+def upload_check():
+    data = request.json or {}
+    content_hash = str(data.get('hash', '')).lower()
+    try:
+        size = int(data.get('size', -1))
+    except (TypeError, ValueError):
+        size = -1
+    name = data.get('name', '')
+    relative_path = data.get('relativePath', '')
+    if len(content_hash) != 64 or size < 0 or not (name or relative_path):
+        return jsonify({'status': 'error', 'msg': '参数无效'}), 400
+    
+    src, entry = find_content(content_hash, size)
+    if not src:
+        return jsonify({'status': 'success', 'exists': False})
+    try:
+        dest_path = upload_dest_path(get_safe_path(data.get('path', '')), name or relative_path, relative_path)
+    except ValueError:
+        return jsonify({'status': 'error', 'msg': '非法路径'}), 403
+    try:
+        if not link_duplicate(src, dest_path):
+            return jsonify({'status': 'success', 'exists': False})
+        index_update_path(dest_path)
+        # 内容与已分析过的文件相同，直接沿用哈希和元数据，后处理只需生成缩略图
+        st = os.stat(dest_path)
+        with _index_lock:
+            db.session.execute(
+                db.update(FileEntry)
+                .where(FileEntry.path == index_rel_path(dest_path), FileEntry.mtime == st.st_mtime)
+                .values(content_hash=content_hash, media_meta=entry.media_meta)
+                .execution_options(synchronize_session=False))
+            db.session.commit()
+        enqueue_ingest(dest_path)
+        return jsonify({'status': 'success', 'exists': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'msg': str(e)}), 500
+
+# --- 辅助函数：分块上传 ---
+# 大文件先登记上传会话，再按序号并行 PUT 各个分块，断线后查询已收到的分块只补传缺失部分，最后提交。
+# 分块按偏移写入与目标文件同目录的隐藏暂存文件（初始化时截断到完整大小，文件系统上为稀疏文件），
+# 提交时原子重命名为目标文件。会话和已完成的分块记录在数据库中，多个工作进程可以同时接收同一个上传的分块
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024      # 默认分块大小
+UPLOAD_CHUNK_MAX = 64 * 1024 * 1024      # 客户端可申请的最大分块大小
+UPLOAD_STAGING_SUFFIX = '.uploading'     # 暂存文件后缀，打包下载时跳过
+UPLOAD_SESSION_TTL = 7 * 24 * 3600       # 暂存文件超过这个时间没有写入时，清理任务删除会话
+
+def upload_chunk_count(upload):
+    return max(1, -(-upload.size // upload.chunk_size))
+
+def upload_chunk_span(upload, chunk):
+    """返回分块在文件中的 (起始偏移, 长度)"""
+    start = chunk * upload.chunk_size
+    return start, min(upload.chunk_size, upload.size - start)
+
+def upload_received(upload):
+    """已收到的分块序号（升序）"""
+    return list(db.session.execute(
+        db.select(UploadChunk.chunk).filter_by(upload_id=upload.id).order_by(UploadChunk.chunk)).scalars())
+
+def upload_received_ranges(upload, received):
+    """把已收到的分块合并为 [起始, 结束) 字节区间"""
+    ranges = []
+    for chunk in received:
+        start, length = upload_chunk_span(upload, chunk)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = start + length
+        else:
+            ranges.append([start, start + length])
+    return ranges
+
+def discard_upload(upload):
+    """删除上传会话、分块记录和暂存文件"""
+    try:
+        os.remove(os.path.join(STORAGE_DIR, upload.staging))
+    except FileNotFoundError:
+        pass
+    db.session.execute(db.delete(UploadChunk).filter_by(upload_id=upload.id))
+    db.session.delete(upload)
+    db.session.commit()
+
+def cleanup_stale_uploads():
+    """删除长时间没有写入的上传会话及其暂存文件"""
+    with app.app_context():
+        now = time.time()
+        for upload in UploadSession.query.all():
+            try:
+                mtime = os.path.getmtime(os.path.join(STORAGE_DIR, upload.staging))
+            except OSError:
+                mtime = upload.created_at.timestamp()
+            if now - mtime > UPLOAD_SESSION_TTL:
+                try:
+                    discard_upload(upload)
+                    print(f"已删除过期的上传会话: {upload.path}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"清理上传会话失败: {e}")
+
+def upload_status(upload):
+    received = upload_received(upload)
+    return {
+        'status': 'success',
+        'upload_id': upload.id,
+        'size': upload.size,
+        'chunk_size': upload.chunk_size,
+        'chunks': upload_chunk_count(upload),
+        'received': received,
+        'ranges': upload_received_ranges(upload, received),
+    }
+
+# --- 接口：分块上传 ---
+@app.route('/api/upload/init', methods=['POST'])
+@login_required
+def upload_init():
+    data = request.json or {}
+    try:
+        size = int(data.get('size', -1))
+        chunk_size = int(data.get('chunkSize') or UPLOAD_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'msg': '参数无效'}), 400
+    name = data.get('name', '')
+    relative_path = data.get('relativePath', '')
+    if size < 0 or not (name or relative_path) or not 0 < chunk_size <= UPLOAD_CHUNK_MAX:
+        return jsonify({'status': 'error', 'msg': '参数无效'}), 400
+    if size > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'status': 'error', 'msg': '文件超过上传大小限制'}), 400
+    
+    try:
+        dest_path = upload_dest_path(get_safe_path(data.get('path', '')), name or relative_path, relative_path)
+    except ValueError:
+        return jsonify({'status': 'error', 'msg': '非法路径'}), 403
+    
+    upload_id = uuid.uuid4().hex
+    staging_path = os.path.join(os.path.dirname(dest_path),
+                                f".{os.path.basename(dest_path)}.{upload_id[:8]}{UPLOAD_STAGING_SUFFIX}")
+    try:
+        with open(staging_path, 'wb') as f:
+            f.truncate(size)
+        upload = UploadSession(id=upload_id, path=get_rel_path(dest_path), staging=get_rel_path(staging_path),
+                               size=size, chunk_size=chunk_size)
+        db.session.add(upload)
+        db.session.commit()
+        return jsonify(upload_status(upload))
+    except Exception as e:
+        db.session.rollback()
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+        return jsonify({'status': 'error', 'msg': str(e)}), 500
+
+@app.route('/api/upload/<upload_id>', methods=['GET'])
+@login_required
+def upload_query(upload_id):
+    upload = db.session.get(UploadSession, upload_id)
+    if not upload:
+        return jsonify({'status': 'error', 'msg': '上传会话不存在或已过期'}), 404
+    return jsonify(upload_status(upload))
+
+@app.route('/api/upload/<upload_id>/<int:chunk>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id, chunk):
+    upload = db.session.get(UploadSession, upload_id)
+    if not upload:
+        return jsonify({'status': 'error', 'msg': '上传会话不存在或已过期'}), 404
+    if not 0 <= chunk < upload_chunk_count(upload):
+        return jsonify({'status': 'error', 'msg': '分块序号超出范围'}), 400
+    start, length = upload_chunk_span(upload, chunk)
+    if (request.content_length or 0) != length:
+        return jsonify({'status': 'error', 'msg': f'分块大小应为 {length} 字节'}), 400
+    
+    # 各分块写入不重叠的区域，并发请求各自打开文件、按偏移写入即可
+    written = 0
+    try:
+        with open(os.path.join(STORAGE_DIR, upload.staging), 'r+b') as f:
+            f.seek(start)
+            while written < length:
+                data = request.stream.read(min(1024 * 1024, length - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+    except FileNotFoundError:
+        return jsonify({'status': 'error', 'msg': '上传会话不存在或已过期'}), 404
+    if written != length:
+        # 连接中断，分块不完整，不记录（客户端重传即可覆盖）
+        return jsonify({'status': 'error', 'msg': '分块数据不完整'}), 400
+    
+    try:
+        db.session.merge(UploadChunk(upload_id=upload.id, chunk=chunk))
+        db.session.commit()
+    except Exception:
+        # 同一分块被重复上传时另一个请求已记录
+        db.session.rollback()
+    return jsonify({'status': 'success', 'chunk': chunk})
+
+@app.route('/api/upload/<upload_id>/commit', methods=['POST'])
+@login_required
+def upload_commit(upload_id):
+    upload = db.session.get(UploadSession, upload_id)
+    if not upload:
+        return jsonify({'status': 'error', 'msg': '上传会话不存在或已过期'}), 404
+    received = upload_received(upload)
+    missing = upload_chunk_count(upload) - len(received)
+    if missing:
+        return jsonify({'status': 'error', 'msg': f'还有 {missing} 个分块未上传', 'received': received}), 409
     
     try:
-        save_dir = get_safe_path(current_path)
-        
-        if file:
-            # 安全的文件名处理函数（保留中文）
-            def safe_filename(filename):
-                # 只移除危险字符，保留中文和其他字符
-                dangerous_chars = ['..', '/', '\\', '\0', '<', '>', ':', '"', '|', '?', '*']
-                for char in dangerous_chars:
-                    filename = filename.replace(char, '_')
-                return filename.strip()
-            
-            # 如果有相对路径（文件夹上传），保持目录结构
-            if relative_path and '/' in relative_path:
-                # 提取目录部分
-                path_parts = relative_path.split('/')
-                if len(path_parts) > 1:
-                    # 创建子目录（保留中文目录名）
-                    safe_parts = [safe_filename(part) for part in path_parts[:-1]]
-                    sub_dir = os.path.join(save_dir, *safe_parts)
-                    os.makedirs(sub_dir, exist_ok=True)
-                    filename = safe_filename(path_parts[-1])
-                    file.save(os.path.join(sub_dir, filename))
-                else:
-                    filename = safe_filename(relative_path)
-                    file.save(os.path.join(save_dir, filename))
-            else:
-                # 普通文件上传
-                filename = safe_filename(file.filename)
-                file.save(os.path.join(save_dir, filename))
-                
+        dest_path = os.path.join(STORAGE_DIR, upload.path)
+        os.replace(os.path.join(STORAGE_DIR, upload.staging), dest_path)
+        db.session.execute(db.delete(UploadChunk).filter_by(upload_id=upload.id))
+        db.session.delete(upload)
+        db.session.commit()
+        index_update_path(dest_path)
+        enqueue_ingest(dest_path)
         return jsonify({'status': 'success'})
+    except FileNotFoundError:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'msg': '上传会话不存在或已过期'}), 404
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({'status': 'error', 'msg': str(e)})
+        db.session.rollback()
+        return jsonify({'status': 'error', 'msg': str(e)}), 500
+
+@app.route('/api/upload/<upload_id>', methods=['DELETE'])
+@login_required
+def upload_abort(upload_id):
+    upload = db.session.get(UploadSession, upload_id)
+    if upload:
+        discard_upload(upload)
+    return jsonify({'status': 'success'})
 
 # --- 接口：创建分享 ---
 @app.route('/api/share', methods=['POST'])
@@ -783,26 +2965,838 @@ def create_share():
     share_url = request.host_url + 's/' + token
     return jsonify({'status': 'success', 'url': share_url})
 
-# --- 辅助函数：打包文件夹为 ZIP ---
-def zip_folder(folder_path, zip_name):
-    """将文件夹打包为 ZIP 文件并返回文件路径"""
-    # 使用时间戳和随机字符串避免文件名冲突
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    random_str = shortuuid.uuid()[:6]
-    safe_zip_name = f"{zip_name}_{timestamp}_{random_str}.zip"
-    zip_path = os.path.join(FOLDERZIP_DIR, safe_zip_name)
-    
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, folder_path)
+# --- 辅助函数：流式打包 ZIP ---
+# 边读边压缩，压缩结果直接写入响应，不落盘、首字节无需等待整个压缩包生成。
+# 每个条目的 CRC 和大小在数据之后以数据描述符（通用标志位 bit 3）写出；
+# 大文件和 4GB 之后的偏移使用 ZIP64 扩展
+ZIP_CHUNK_SIZE = 1024 * 1024          # 读取源文件的块大小
+ZIP64_MEMBER_THRESHOLD = 0xF0000000   # 原始大小超过此值的条目按 ZIP64 写出（为压缩后可能略微变大留出余量）
+
+# --- 辅助函数：ZIP 条目压缩策略 ---
+# 视频、压缩包、常见图片/音频格式本身已经压缩，再用 DEFLATE 几乎不会变小，直接存储（STORED）；
+# 其余类型按 app.config['ZIP_DEFLATE_LEVELS'] 中的级别压缩，未知类型先试压文件开头判断是否值得压缩
+app.config['ZIP_DEFLATE_LEVELS'] = {'default': 6, 'office': 6, 'pdf': 6, 'image': 6, 'audio': 6}  # 按 get_file_type 分类，0 表示不压缩
+ZIP_UNCOMPRESSED_MEDIA_EXTS = {'.bmp', '.svg', '.ico', '.wav'}  # 图片/音频中未压缩的格式
+ZIP_PRECOMPRESSED_EXTS = {'.docx', '.xlsx', '.pptx', '.jar', '.apk', '.epub', '.woff', '.woff2',
+                          '.heic', '.avif', '.lz4', '.zst', '.lzma', '.dmg', '.iso'}
+ZIP_SAMPLED_TYPES = ('file', 'pdf')  # 需要试压样本才能决定压缩方式的类型
+ZIP_SAMPLE_SIZE = 64 * 1024  # 试压的样本大小
+ZIP_SAMPLE_MAX_RATIO = 0.95  # 样本压缩后仍超过原大小的这个比例时直接存储
+
+def zip_compression_for(name, head=b''):
+    """返回条目的 (压缩方式, DEFLATE 级别)；head 为文件开头的数据，用于判断未知类型"""
+    ext = os.path.splitext(name.lower())[1]
+    file_type = get_file_type(name)
+    if file_type in ('video', 'archive') or ext in ZIP_PRECOMPRESSED_EXTS:
+        return zipfile.ZIP_STORED, 0
+    if file_type in ('image', 'audio') and ext not in ZIP_UNCOMPRESSED_MEDIA_EXTS:
+        return zipfile.ZIP_STORED, 0
+    
+    levels = app.config['ZIP_DEFLATE_LEVELS']
+    level = levels.get(file_type, levels['default'])
+    if level <= 0:
+        return zipfile.ZIP_STORED, 0
+    if file_type in ZIP_SAMPLED_TYPES and len(head) >= 1024:
+        # 熵很高的数据（加密、已压缩的未知格式）试压后几乎没有收益
+        sample = head[:ZIP_SAMPLE_SIZE]
+        if len(zlib.compress(sample, 1)) > len(sample) * ZIP_SAMPLE_MAX_RATIO:
+            return zipfile.ZIP_STORED, 0
+    return zipfile.ZIP_DEFLATED, level
+
+def collect_zip_members(abs_path, prefix=''):
+    """列出打包 abs_path 所需的 (归档内名称, 绝对路径)，文件夹展开为其下所有文件"""
+    if not os.path.isdir(abs_path):
+        return [(os.path.join(prefix, os.path.basename(abs_path)).replace('\\', '/'), abs_path)]
+    members = []
+    for root, dirs, files in os.walk(abs_path):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(UPLOAD_STAGING_SUFFIX): continue # 上传中的暂存文件
+            file_path = os.path.join(root, file)
+            arcname = os.path.join(prefix, os.path.relpath(file_path, abs_path))
+            members.append((arcname.replace('\\', '/'), file_path))
+    return members
+
+def _zip_dos_time(timestamp):
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1  # ZIP 无法表示 1980 年之前的时间，取 1980-01-01
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+def _zip_central_directory(entries, cd_offset):
+    """中央目录和目录结束记录；entries 为每个条目的 (名称, 压缩方式, 时间, 日期, CRC, 压缩大小, 原始大小, 本地头偏移, mode)"""
+    records = []
+    for name, method, dostime, dosdate, crc, comp_size, size, header_offset, mode in entries:
+        zip64_fields = []
+        if size >= 0xFFFFFFFF or comp_size >= 0xFFFFFFFF:
+            zip64_fields += [size, comp_size]
+            size = comp_size = 0xFFFFFFFF
+        if header_offset >= 0xFFFFFFFF:
+            zip64_fields.append(header_offset)
+            header_offset = 0xFFFFFFFF
+        extra = struct.pack(f'<HH{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b''
+        records.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | 45, 45 if zip64_fields else 20,
+                                   0x0808, method, dostime, dosdate, crc, comp_size, size, len(name), len(extra),
+                                   0, 0, 0, (mode & 0xFFFF) << 16, header_offset) + name + extra)
+    central = b''.join(records)
+    
+    count, cd_size = len(entries), len(central)
+    if count >= 0xFFFF or cd_size >= 0xFFFFFFFF or cd_offset >= 0xFFFFFFFF:
+        zip64_end_offset = cd_offset + cd_size
+        central += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        central += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+        count, cd_size, cd_offset = min(count, 0xFFFF), min(cd_size, 0xFFFFFFFF), min(cd_offset, 0xFFFFFFFF)
+    return central + struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0)
+
+# --- 辅助函数：并行压缩 ZIP 条目 ---
+# 条目按 ZIP_CHUNK_SIZE 切成块，在线程池中并行压缩和计算 CRC（zlib 在处理大块数据时会释放 GIL），
+# 响应线程按顺序取回结果写出。每块以前一块末尾 32KB 作为预置字典、以 Z_SYNC_FLUSH 结束（最后一块 Z_FINISH），
+# 各块依次拼接仍是一个完整的 DEFLATE 流（与 pigz 的做法相同）；整个条目的 CRC 由各块的 CRC 合并得到
+ZIP_DICT_SIZE = 32 * 1024  # DEFLATE 回溯窗口大小
+ZIP_PIPELINE_DEPTH = 2     # 每个压缩线程对应的预读块数，限制单个下载占用的内存
+_zip_pool = None
+_zip_pool_lock = threading.Lock()
+
+def _zip_get_pool():
+    global _zip_pool
+    with _zip_pool_lock:
+        if _zip_pool is None:
+            _zip_pool = ThreadPoolExecutor(app.config['ZIP_WORKERS'], thread_name_prefix='zip')
+        return _zip_pool
+
+def _zip_compress_block(data, level, zdict, last):
+    """压缩一块数据，返回 (写出的数据, 原始数据的 CRC, 原始长度)；level 为 None 时原样存储"""
+    crc = zlib.crc32(data)
+    if level is None:
+        return data, crc, len(data)
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    out = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return out, crc, len(data)
+
+def _gf2_matrix_times(mat, vec):
+    total = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            total ^= mat[i]
+        vec >>= 1
+        i += 1
+    return total
+
+@lru_cache(maxsize=None)
+def _crc32_zeros_operator(k):
+    """在 CRC32 后追加 2**k 个零字节对应的 GF(2) 矩阵（32 列）"""
+    if k == 0:
+        op = [0xEDB88320] + [1 << n for n in range(31)]  # 追加一个零比特
+        for _ in range(3):
+            op = [_gf2_matrix_times(op, col) for col in op]
+        return op
+    op = _crc32_zeros_operator(k - 1)
+    return [_gf2_matrix_times(op, col) for col in op]
+
+def crc32_combine(crc1, crc2, len2):
+    """由前后两段数据各自的 CRC32 得到拼接后的 CRC32（同 zlib 的 crc32_combine），len2 为后一段的长度"""
+    k = 0
+    while len2:
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(_crc32_zeros_operator(k), crc1)
+        len2 >>= 1
+        k += 1
+    return crc1 ^ crc2
+
+def _zip_entry_blocks(entry, pool, skip=0):
+    """把条目的数据分块提交压缩，产出各块的 ('block', Future)；STORED 条目可以从原始数据的 skip 处开始"""
+    level = entry['level'] if entry['method'] == zipfile.ZIP_DEFLATED else None
+    with open(entry['path'], 'rb') as f:
+        if skip:
+            f.seek(skip)
+        remaining = entry['size'] - skip
+        chunk = f.read(min(ZIP_CHUNK_SIZE, remaining))
+        zdict = b''
+        while True:
+            remaining -= len(chunk)
+            next_chunk = f.read(min(ZIP_CHUNK_SIZE, remaining)) if chunk and remaining else b''
+            yield 'block', pool.submit(_zip_compress_block, chunk, level, zdict, not next_chunk)
+            if not next_chunk:
+                break
+            zdict = chunk[-ZIP_DICT_SIZE:]
+            chunk = next_chunk
+    if remaining:
+        raise ValueError(f"文件在打包过程中发生变化: {entry['path']}")
+
+def _zip_pipeline(tasks):
+    """按顺序取回 tasks 中的各项，('block', Future) 替换为 ('block', 压缩结果)；
+    同时预读后续的块提交给线程池，让所有压缩线程保持忙碌"""
+    depth = app.config['ZIP_WORKERS'] * ZIP_PIPELINE_DEPTH
+    pending = deque()
+    in_flight = 0
+    try:
+        while True:
+            while in_flight < depth:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending.append(task)
+                if task[0] == 'block':
+                    in_flight += 1
+            if not pending:
+                break
+            kind, payload = pending.popleft()
+            if kind == 'block':
+                in_flight -= 1
+                payload = payload.result()
+            yield kind, payload
+    finally:
+        # 客户端中途断开时关闭正在读取的文件，取消还没开始压缩的块
+        tasks.close()
+        for kind, payload in pending:
+            if kind == 'block':
+                payload.cancel()
+
+def _zip_measure(entries, pool):
+    """完整读取（并压缩）entries 中的条目，填入压缩后大小和 CRC"""
+    def tasks():
+        for entry in entries:
+            yield 'member', entry
+            yield from _zip_entry_blocks(entry, pool)
+            yield 'end', entry
+    
+    for kind, payload in _zip_pipeline(tasks()):
+        if kind == 'member':
+            crc = comp_size = 0
+        elif kind == 'block':
+            data, block_crc, block_size = payload
+            crc = crc32_combine(crc, block_crc, block_size)
+            comp_size += len(data)
+        else:
+            payload['crc'] = crc
+            payload['comp_size'] = comp_size
+
+# --- 辅助函数：确定性的 ZIP 布局（断点续传）---
+# 同一份内容清单总是生成逐字节相同的压缩包：成员按归档内名称排序，时间取各文件的 mtime，
+# 每个条目的压缩方式、压缩后大小、偏移和 CRC 记录在布局文件 FOLDERZIP_DIR/<清单哈希>.json 中。
+# 第一次完整下载边压缩边发送（不预先给出总大小），发送完成时得到的布局写入布局文件，
+# 之后的下载在发送第一个字节前就知道总大小（Content-Length），Range 请求只读取、压缩与所请求区间重叠的条目。
+# 还没有布局文件时的 Range 请求需要先把 DEFLATE 条目压缩一遍才能知道各条目的偏移，
+# 预先压缩的数据量超过 ZIP_PRESIZE_MAX_BYTES 时忽略 Range，发送完整的压缩包；
+# STORED 条目的 CRC 在第一次完整读取时记入布局文件，续传时只有区间之前的条目才需要单独计算
+ZIP_PRESIZE_MAX_BYTES = 512 * 1024 * 1024
+
+def _zip_local_header(entry):
+    name = entry['name'].encode('utf-8')
+    zip64 = entry['zip64']
+    extra = struct.pack('<HHQQ', 1, 16, 0, 0) if zip64 else b''
+    return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, 0x0808, entry['method'],
+                       entry['dostime'], entry['dosdate'], 0, 0xFFFFFFFF if zip64 else 0, 0xFFFFFFFF if zip64 else 0,
+                       len(name), len(extra)) + name + extra
+
+def _zip_descriptor(entry):
+    return struct.pack('<IIQQ' if entry['zip64'] else '<IIII', 0x08074b50, entry['crc'] or 0,
+                       entry['comp_size'], entry['size'])
+
+def _zip_central(layout):
+    return _zip_central_directory([(entry['name'].encode('utf-8'), entry['method'], entry['dostime'], entry['dosdate'],
+                                    entry['crc'] or 0, entry['comp_size'], entry['size'], entry['offset'], entry['mode'])
+                                   for entry in layout['entries']], layout['cd_offset'])
+
+def save_zip_layout(layout):
+    """把布局（不含文件的绝对路径）写入布局文件"""
+    if not layout.get('manifest'):
+        return
+    data = {'entries': [{key: value for key, value in entry.items() if key != 'path'} for entry in layout['entries']],
+            'cd_offset': layout['cd_offset'], 'size': layout['size']}
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=FOLDERZIP_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, os.path.join(FOLDERZIP_DIR, layout['manifest'] + '.json'))
+    except OSError as e:
+        print(f"保存 ZIP 布局失败: {e}")
+
+def zip_entries(members):
+    """按归档内名称排序的条目及各自的压缩方式，只读取文件信息（和试压样本），压缩后大小、CRC 和偏移尚未确定"""
+    paths = {}
+    for arcname, abs_path in members:
+        paths.setdefault(arcname, abs_path)
+    entries = []
+    for arcname in sorted(paths):
+        abs_path = paths[arcname]
+        try:
+            st = os.stat(abs_path)
+            head = b''
+            if get_file_type(arcname) in ZIP_SAMPLED_TYPES:
+                with open(abs_path, 'rb') as f:
+                    head = f.read(ZIP_SAMPLE_SIZE)
+        except OSError as e:
+            print(f"打包文件失败 {abs_path}: {e}")
+            continue
+        method, level = zip_compression_for(arcname, head)
+        dostime, dosdate = _zip_dos_time(st.st_mtime)
+        # 边压缩边发送时写本地文件头还不知道压缩后大小，是否使用 ZIP64 只按原始大小决定
+        entries.append({'name': arcname, 'path': abs_path, 'method': method, 'level': level,
+                        'size': st.st_size, 'comp_size': st.st_size, 'crc': None if st.st_size else 0,
+                        'dostime': dostime, 'dosdate': dosdate, 'mode': st.st_mode,
+                        'zip64': st.st_size >= ZIP64_MEMBER_THRESHOLD})
+    return entries
+
+def zip_size_bound(members):
+    """members 打包后大小的上限（按所有条目都压缩、压缩后略微变大估计），用于还不知道布局时预留缓存空间"""
+    total = 22 + 56 + 20  # 目录结束记录和 ZIP64 目录结束记录
+    for arcname, abs_path in members:
+        try:
+            size = os.stat(abs_path).st_size
+        except OSError:
+            continue
+        blocks = size // ZIP_CHUNK_SIZE + 1
+        total += size + size // 2048 + 24 * blocks + 2 * len(arcname.encode('utf-8')) + 200
+    return total
+
+def zip_layout(members, manifest=None, measure=True):
+    """members 打包后的布局 {'entries', 'cd_offset', 'size'}；给出 manifest 时读取或保存对应的布局文件。
+    没有布局文件时需要把 DEFLATE 条目压缩一遍：measure 为 False，或需要压缩的数据超过 ZIP_PRESIZE_MAX_BYTES 时返回 None"""
+    if manifest:
+        paths = {}
+        for arcname, abs_path in members:
+            paths.setdefault(arcname, abs_path)
+        try:
+            with open(os.path.join(FOLDERZIP_DIR, manifest + '.json'), 'r', encoding='utf-8') as f:
+                layout = json.load(f)
+            for entry in layout['entries']:
+                entry['path'] = paths[entry['name']]  # 内容相同的其他文件夹也可以共用布局，路径以本次为准
+            layout['manifest'] = manifest
+            return layout
+        except (OSError, ValueError, KeyError):
+            pass
+    if not measure:
+        return None
+    
+    entries = zip_entries(members)
+    deflated = [entry for entry in entries if entry['method'] == zipfile.ZIP_DEFLATED]
+    if sum(entry['size'] for entry in deflated) > ZIP_PRESIZE_MAX_BYTES:
+        return None
+    _zip_measure(deflated, _zip_get_pool())
+    layout = _zip_place(entries, manifest)
+    save_zip_layout(layout)
+    return layout
+
+def _zip_place(entries, manifest):
+    """按各条目压缩后的大小排出偏移，得到完整的布局"""
+    offset = 0
+    for entry in entries:
+        entry['offset'] = offset
+        offset += len(_zip_local_header(entry)) + entry['comp_size'] + len(_zip_descriptor(entry))
+    layout = {'entries': entries, 'cd_offset': offset, 'manifest': manifest}
+    layout['size'] = offset + len(_zip_central(layout))
+    return layout
+
+def _zip_range_tasks(layout, start, stop, pool):
+    """按归档顺序产出与 [start, stop) 重叠的部分：('bytes', (偏移, 数据))、('member', (条目, 偏移, 是否完整))、
+    条目数据各块的 ('block', Future)、('descriptor', (偏移, 条目)) 和 ('central', 偏移)"""
+    for entry in layout['entries']:
+        header = _zip_local_header(entry)
+        data_start = entry['offset'] + len(header)
+        data_end = data_start + entry['comp_size']
+        if data_end + len(_zip_descriptor(entry)) <= start:
+            continue
+        if entry['offset'] >= stop:
+            return
+        yield 'bytes', (entry['offset'], header)
+        if data_start < stop and data_end > start:
+            # STORED 条目直接从区间起点读取，DEFLATE 条目需要从头压缩后丢弃区间之前的部分
+            skip = start - data_start if entry['method'] == zipfile.ZIP_STORED and start > data_start else 0
+            yield 'member', (entry, data_start + skip, skip == 0)
+            yield from _zip_entry_blocks(entry, pool, skip)
+        if data_end < stop:
+            yield 'descriptor', (data_end, entry)
+    if layout['cd_offset'] < stop:
+        yield 'central', layout['cd_offset']
+
+def _zip_fill_crcs(layout, start, stop, pool):
+    """区间内要写出的数据描述符和中央目录需要 CRC，其条目数据又不在本区间内完整读取时，先单独计算这些 CRC"""
+    cd_needed = layout['cd_offset'] < stop
+    missing = []
+    for entry in layout['entries']:
+        if entry['crc'] is not None:
+            continue
+        data_start = entry['offset'] + len(_zip_local_header(entry))
+        data_end = data_start + entry['comp_size']
+        if data_start < start and (cd_needed or data_end < stop and data_end + len(_zip_descriptor(entry)) > start):
+            missing.append(entry)
+    if missing:
+        _zip_measure(missing, pool)
+        save_zip_layout(layout)
+
+def iter_zip_range(layout, start, stop):
+    """产出按 layout 打包的压缩包中 [start, stop) 区间的数据"""
+    pool = _zip_get_pool()
+    _zip_fill_crcs(layout, start, stop, pool)
+    learned = False
+    streamed = None  # 本次从头完整读取的条目
+    pos = start
+    try:
+        for kind, payload in _zip_pipeline(_zip_range_tasks(layout, start, stop, pool)):
+            if kind == 'member':
+                entry, pos, whole = payload
+                streamed = entry if whole else None
+                crc = size = comp_size = 0
+                continue
+            if kind == 'block':
+                data, block_crc, block_size = payload
+                crc = crc32_combine(crc, block_crc, block_size)
+                size += block_size
+                comp_size += len(data)
+            elif kind == 'bytes':
+                pos, data = payload
+            elif kind == 'descriptor':
+                pos, entry = payload
+                if entry is streamed and (size, comp_size) != (entry['size'], entry['comp_size']):
+                    raise ValueError(f"文件在打包过程中发生变化: {entry['path']}")
+                if entry['crc'] is None and entry is streamed:
+                    entry['crc'] = crc
+                    learned = True
+                data = _zip_descriptor(entry)
+            else:
+                pos, data = payload, _zip_central(layout)
+            
+            piece = data[max(start - pos, 0):max(stop - pos, 0)]
+            pos += len(data)
+            if piece:
+                yield piece
+            if pos >= stop:
+                break
+    finally:
+        if learned:
+            save_zip_layout(layout)
+
+def iter_zip_stream(members, manifest=None):
+    """按 members 边压缩边产出完整的 ZIP 数据，不需要预先知道各条目压缩后的大小；打开失败的文件跳过，
+    压缩方式由 zip_compression_for 决定。产出的数据与按布局生成的逐字节相同，
+    给出 manifest 时完整产出后把得到的布局写入布局文件，之后的下载和续传直接使用"""
+    entries = zip_entries(members)
+    pool = _zip_get_pool()
+    
+    def tasks():
+        for entry in entries:
+            yield 'member', entry
+            yield from _zip_entry_blocks(entry, pool)
+            yield 'end', entry
+    
+    offset = 0
+    for kind, payload in _zip_pipeline(tasks()):
+        if kind == 'member':
+            entry = payload
+            entry['offset'] = offset
+            data = _zip_local_header(entry)
+            crc = size = comp_size = 0
+        elif kind == 'block':
+            data, block_crc, block_size = payload
+            crc = crc32_combine(crc, block_crc, block_size)
+            size += block_size
+            comp_size += len(data)
+        else:
+            if size != entry['size']:
+                raise ValueError(f"文件在打包过程中发生变化: {entry['path']}")
+            entry['crc'], entry['comp_size'] = crc, comp_size
+            data = _zip_descriptor(entry)
+        offset += len(data)
+        if data:
+            yield data
+    
+    layout = {'entries': entries, 'cd_offset': offset, 'manifest': manifest}
+    central = _zip_central(layout)
+    layout['size'] = offset + len(central)
+    yield central
+    if manifest and zip_manifest(members) == manifest:
+        save_zip_layout(layout)
+
+def attachment_headers(download_name):
+    """Content-Disposition 附件头，非 ASCII 文件名按 RFC 5987 编码（与 send_file 一致）"""
+    headers = Headers()
+    try:
+        download_name.encode('ascii')
+        headers.set('Content-Disposition', 'attachment', filename=download_name)
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = url_quote(download_name, safe="!#$&+-.^_`|~")
+        headers.set('Content-Disposition', 'attachment', **{'filename': simple, 'filename*': f"UTF-8''{quoted}"})
+    return headers
+
+# --- 辅助函数：按内容清单缓存 ZIP ---
+# 压缩包以成员清单（归档内名称、大小、mtime）的哈希命名保存在 FOLDERZIP_DIR 中，
+# 文件夹内容未变化时再次下载、或不同分享链接打包相同内容时直接发送已有的压缩包
+ZIP_MANIFEST_VERSION = b'netdisk-zip-4'  # 打包格式变化时修改，使旧缓存失效
+
+def zip_manifest(members):
+    """members 的内容清单哈希，任一文件增删、改名或修改都会得到不同的值"""
+    entries = []
+    for arcname, abs_path in members:
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            continue
+        entries.append(f"{arcname}\0{st.st_size}\0{st.st_mtime_ns}\n")
+    digest = hashlib.sha256(ZIP_MANIFEST_VERSION + zlib.ZLIB_RUNTIME_VERSION.encode('ascii'))  # 不同 zlib 版本的压缩结果可能不同
+    digest.update(json.dumps(app.config['ZIP_DEFLATE_LEVELS'], sort_keys=True).encode('utf-8'))  # 压缩级别不同，生成的压缩包也不同
+    for entry in sorted(entries):
+        digest.update(entry.encode('utf-8'))
+    return digest.hexdigest()
+
+# --- 辅助函数：合并同一压缩包的并发打包 ---
+# 同一内容清单同时只有一次打包。第一个下载者直接发送自己推进生成的数据，同时写入 FOLDERZIP_DIR 中的临时文件；
+# 之后加入的下载从临时文件中读取已经写出的部分，读到尚未生成的位置时由它接着推进，CPU 开销不随同时下载的人数增加。
+# 所有下载者都断开时由后台线程把打包完成，完整生成且期间内容未变化时放入缓存，之后的下载和续传直接使用。
+# 只有压缩包不超过缓存容量时才这样落盘；更大的压缩包不写临时文件，每个下载各自边生成边发送。
+# 清单相同即内容相同，因此不同分享链接、分享链接与站内下载之间也共用同一次打包
+ZIP_TAIL_WINDOW = 256 * 1024 * 1024  # Range 请求的起点超出打包进度这么多时直接生成该区间，不等待打包
+ZIP_BUILD_IDLE_WAIT = 5  # 新建的打包等待第一个下载者开始读取的时间（秒），超时仍没有下载者时由后台线程接手
+_zip_builds = {}  # 清单哈希 -> 进行中的打包
+_zip_builds_lock = threading.Lock()
+
+def _zip_build_finish(build, error=None):
+    """打包结束：完整生成且期间内容未变化时把临时文件放入缓存，否则删除；释放预留的空间"""
+    manifest = build['manifest']
+    cache_path = os.path.join(FOLDERZIP_DIR, manifest + '.zip')
+    cached = False
+    try:
+        build['file'].close()
+        if error is None and zip_manifest(build['members']) == manifest:
+            os.replace(build['path'], cache_path)
+            cached = True
+    except OSError as e:
+        error = e
+    if error is not None:
+        print(f"打包失败 {manifest}: {error}")
+    with _zip_builds_lock:
+        _zip_builds.pop(manifest, None)
+    with build['cond']:
+        if cached:
+            build['path'] = cache_path
+        elif os.path.exists(build['path']):
+            os.remove(build['path']) # 已经打开临时文件的下载不受影响
+        build['error'] = error
+        build['finished'] = True
+        build['cond'].notify_all()
+    # 放入缓存后改由缓存文件占用这部分空间
+    _zip_cache_add((build['written'] if cached else 0) - build['reserved'])
+
+def _zip_build_step(build):
+    """推进打包：生成下一块数据写入临时文件，返回 (这块数据在压缩包中的偏移, 数据)，打包结束时返回 None。
+    调用前需要先把 build['producing'] 置为 True，同一时间只有一个线程推进"""
+    try:
+        chunk = next(build['source'], None)
+        if chunk is not None:
+            build['file'].write(chunk)
+            build['file'].flush() # 其他下载通过另外打开的文件读取
+    except Exception as e:
+        _zip_build_finish(build, e)
+        return None
+    if chunk is None:
+        _zip_build_finish(build)
+        return None
+    with build['cond']:
+        offset = build['written']
+        build['written'] += len(chunk)
+        build['cond'].notify_all()
+    return offset, chunk
+
+def _zip_build_drain(build):
+    """没有下载者推进时（都已断开，或只是预先打包）在后台接着打包，直到完成"""
+    cond = build['cond']
+    with cond:
+        cond.wait_for(lambda: build['readers'] or build['finished'], timeout=ZIP_BUILD_IDLE_WAIT)
+    while True:
+        with cond:
+            cond.wait_for(lambda: build['finished'] or not (build['readers'] or build['producing']))
+            if build['finished']:
+                return
+            build['producing'] = True
+        try:
+            _zip_build_step(build)
+        finally:
+            with cond:
+                build['producing'] = False
+                cond.notify_all()
+
+def get_zip_build(members, manifest, layout=None):
+    """返回 manifest 对应的进行中的打包，没有时新建一个；压缩包超出缓存容量时不落盘，返回 None。
+    还不知道布局时边压缩边生成，按大小上限预留缓存空间"""
+    created = False
+    reserve = layout['size'] if layout else zip_size_bound(members)
+    with _zip_builds_lock:
+        build = _zip_builds.get(manifest)
+        if build is None and reserve <= app.config['ZIP_CACHE_MAX_BYTES']:
+            fd, tmp_path = tempfile.mkstemp(dir=FOLDERZIP_DIR, suffix='.tmp')
+            source = iter_zip_range(layout, 0, layout['size']) if layout else iter_zip_stream(members, manifest)
+            build = {'manifest': manifest, 'members': members, 'path': tmp_path, 'file': os.fdopen(fd, 'wb'),
+                     'source': source, 'reserved': reserve,
+                     'cond': threading.Condition(), 'written': 0, 'readers': 0, 'producing': False,
+                     'finished': False, 'error': None}
+            _zip_builds[manifest] = build
+            created = True
+    _zip_cache_count('joins' if build and not created else 'misses')
+    if created:
+        # 开始写入前按压缩包的最终大小（或上限）预留空间，同时进行的大量打包也不会让目录超出容量
+        _zip_cache_add(build['reserved'])
+        threading.Thread(target=_zip_build_drain, args=(build,), daemon=True).start()
+    return build
+
+def iter_zip_build(build, start, stop=None):
+    """产出打包结果的 [start, stop) 区间（stop 为 None 时到结尾）：已经写出的部分从临时文件读取，
+    读到尚未生成的位置时由当前线程推进打包，生成的数据直接发送"""
+    cond = build['cond']
+    f = None
+    pos = start
+    with cond:
+        build['readers'] += 1
+    try:
+        while stop is None or pos < stop:
+            with cond:
+                cond.wait_for(lambda: build['written'] > pos or build['finished'] or not build['producing'])
+                written = build['written']
+                produce = written <= pos and not build['finished']
+                if produce:
+                    build['producing'] = True
+                elif written <= pos:
+                    if stop is None and build['error'] is None:
+                        return
+                    raise RuntimeError(f"打包失败: {build['error']}")
+                elif f is None:
+                    # 打包完成时临时文件会被改名放入缓存，已经打开的文件不受影响
+                    f = open(build['path'], 'rb')
+            
+            if produce:
                 try:
-                    zipf.write(file_path, arcname)
-                except Exception as e:
-                    print(f"打包文件失败 {file_path}: {e}")
+                    step = _zip_build_step(build)
+                finally:
+                    with cond:
+                        build['producing'] = False
+                        cond.notify_all()
+                if step is not None:
+                    offset, chunk = step
+                    piece = chunk[pos - offset:None if stop is None else stop - offset]
+                    if piece:
+                        pos += len(piece)
+                        yield piece
+                continue
+            
+            available = written if stop is None else min(written, stop)
+            f.seek(pos)
+            while pos < available:
+                data = f.read(min(ZIP_CHUNK_SIZE, available - pos))
+                if not data:
+                    raise RuntimeError("打包临时文件被截断")
+                pos += len(data)
+                yield data
+    finally:
+        if f is not None:
+            f.close()
+        with cond:
+            build['readers'] -= 1
+            cond.notify_all() # 最后一个下载者断开时由后台线程接手
+
+def zip_download_response(members, download_name):
+    """下载 members 打包成的 ZIP：命中缓存时直接发送缓存文件，否则加入（或启动）该内容的打包，边生成边发送；
+    以内容清单哈希作为 ETag，支持 Range/If-Range 断点续传和多线程下载"""
+    manifest = zip_manifest(members)
+    cache_path = os.path.join(FOLDERZIP_DIR, manifest + '.zip')
+    try:
+        response = file_response(cache_path, mimetype='application/zip', as_attachment=True,
+                                 download_name=download_name, etag=manifest)
+        os.utime(cache_path) # mtime 记录最近使用时间
+        _zip_cache_count('hits')
+        return _zip_cache_hold(manifest, response)
+    except FileNotFoundError:
+        pass
+    except RequestedRangeNotSatisfiable as e:
+        return e.get_response()
+    
+    headers = attachment_headers(download_name)
+    headers['ETag'] = f'"{manifest}"'
+    headers['Accept-Ranges'] = 'bytes'
+    
+    byte_range = request.range
+    if_range = request.if_range
+    wants_range = byte_range and (if_range.etag == manifest or (if_range.etag is None and if_range.date is None))
+    # 只有 Range 请求在还没有布局文件时才需要预先压缩；完整下载没有布局时边压缩边发送，不给出总大小
+    layout = zip_layout(members, manifest, measure=bool(wants_range))
+    if wants_range and layout is not None:
+        total = layout['size']
+        span = byte_range.range_for_length(total)
+        if span is None:  # 超出范围或多段 Range（与 send_file 一致）
+            headers['Content-Range'] = f"bytes */{total}"
+            return app.response_class(status=416, headers=headers)
+        start, stop = span
+        headers['Content-Range'] = byte_range.make_content_range(total).to_header()
+        headers['Content-Length'] = str(stop - start)
+        with _zip_builds_lock:
+            build = _zip_builds.get(manifest)
+        if build is None and start <= ZIP_TAIL_WINDOW:
+            build = get_zip_build(members, manifest, layout)
+        if build is not None and start <= build['written'] + ZIP_TAIL_WINDOW:
+            body = iter_zip_build(build, start, stop)
+        else:
+            # 多线程下载靠后的分段：等打包进行到这里太久，单独生成这一段
+            body = iter_zip_range(layout, start, stop)
+        return _zip_cache_hold(manifest, app.response_class(body, status=206, mimetype='application/zip',
+                                                           headers=headers))
+    
+    build = get_zip_build(members, manifest, layout)
+    if layout is not None:
+        headers['Content-Length'] = str(layout['size'])
+        body = iter_zip_build(build, 0) if build is not None else iter_zip_range(layout, 0, layout['size'])
+    else:
+        body = iter_zip_build(build, 0) if build is not None else iter_zip_stream(members, manifest)
+    return _zip_cache_hold(manifest, app.response_class(body, mimetype='application/zip', headers=headers))
+
+@job_handler('zip')
+def job_zip(progress, params):
+    """预先打包文件夹：打包完成（放入缓存）后再下载，下载时直接命中缓存；
+    取消只是不再等待，打包由后台线程继续完成"""
+    abs_path = get_safe_path(params['path'])
+    if not os.path.isdir(abs_path):
+        raise ValueError('文件夹不存在')
+    members = collect_zip_members(abs_path)
+    manifest = zip_manifest(members)
+    cache_path = os.path.join(FOLDERZIP_DIR, manifest + '.zip')
+    if os.path.exists(cache_path):
+        size = os.path.getsize(cache_path)
+        progress.set_total(None, size)
+        progress.advance(size)
+        return {'path': params['path'], 'size': size}
+    
+    layout = zip_layout(members, manifest, measure=False)
+    build = get_zip_build(members, manifest, layout)
+    if build is None:
+        raise RuntimeError('压缩包超出打包缓存容量，不能预先打包，请直接下载')
+    # 还不知道布局时总大小按上限估计，完成后更正
+    progress.set_total(None, build['reserved'])
+    # 作为一个下载者推进打包（已经写出的部分不重复读取）；取消时由后台线程接着完成
+    start = build['written']
+    progress.advance(start)
+    pieces = iter_zip_build(build, start)
+    try:
+        for piece in pieces:
+            progress.advance(len(piece))
+    finally:
+        pieces.close()
+    progress.set_total(None, progress.done_bytes)
+    return {'path': params['path'], 'size': progress.done_bytes}
+
+# --- 辅助函数：压缩包缓存容量管理 ---
+# FOLDERZIP_DIR 的总大小以 app.config['ZIP_CACHE_MAX_BYTES'] 为上限，超出时按最近使用时间（命中时刷新 mtime）淘汰，
+# 正在打包和正在发送的压缩包不会被淘汰；每小时检查一次并清理异常退出时残留的临时文件
+ZIP_TMP_MAX_AGE = 3600  # 超过这么久没有写入的临时文件视为残留
+_zip_cache_lock = threading.Lock()
+_zip_cache_bytes = None  # 目录当前占用的估计值，首次写入时扫描目录得到
+_zip_cache_in_use = {}   # 清单哈希 -> 正在发送的响应数
+_zip_cache_stats = {'hits': 0, 'joins': 0, 'misses': 0, 'evictions': 0, 'evicted_bytes': 0}  # 只在 _zip_cache_lock 下修改
+
+def _zip_cache_count(key):
+    with _zip_cache_lock:
+        _zip_cache_stats[key] += 1
+
+def _zip_cache_hold(manifest, response):
+    """响应发送完成（或客户端断开）之前，该清单的压缩包和布局文件不会被淘汰"""
+    with _zip_cache_lock:
+        _zip_cache_in_use[manifest] = _zip_cache_in_use.get(manifest, 0) + 1
+    
+    released = False
+    
+    def release():
+        nonlocal released
+        with _zip_cache_lock:
+            if released:
+                return
+            released = True
+            _zip_cache_in_use[manifest] -= 1
+            if not _zip_cache_in_use[manifest]:
+                del _zip_cache_in_use[manifest]
     
-    return zip_path
+    response.call_on_close(release)  # HEAD、304 等不发送响应体的情况
+    if response.direct_passthrough and hasattr(response.response, 'close'):
+        # send_file 的文件对象直接交给 WSGI 服务器发送，发送完成后只会调用它的 close，不经过 Response.close
+        file_close = response.response.close
+        
+        def close():
+            try:
+                file_close()
+            finally:
+                release()
+        response.response.close = close
+    return response
+
+def _zip_cache_keep():
+    with _zip_builds_lock:
+        keep = {build['path'] for build in _zip_builds.values()}
+    for manifest in _zip_cache_in_use:
+        keep.add(os.path.join(FOLDERZIP_DIR, manifest + '.zip'))
+        keep.add(os.path.join(FOLDERZIP_DIR, manifest + '.json'))
+    return keep
+
+def _zip_cache_enforce():
+    """按容量上限淘汰，返回目录占用加上进行中的打包还未写入的预留空间"""
+    with _zip_builds_lock:
+        reserved = sum(build['reserved'] - build['written'] for build in _zip_builds.values())
+    max_bytes = app.config['ZIP_CACHE_MAX_BYTES']
+    return enforce_cache_budget(FOLDERZIP_DIR, max(max_bytes - reserved, 0), _zip_cache_keep(), _zip_cache_stats) + reserved
+
+def _zip_cache_add(size):
+    """记录新增（或释放）的占用，超出容量时执行淘汰"""
+    global _zip_cache_bytes
+    with _zip_cache_lock:
+        if _zip_cache_bytes is not None:
+            _zip_cache_bytes += size
+        if _zip_cache_bytes is None or _zip_cache_bytes > app.config['ZIP_CACHE_MAX_BYTES']:
+            _zip_cache_bytes = _zip_cache_enforce()
+
+def cleanup_zip_cache():
+    """删除残留的临时文件，并按容量上限淘汰旧的压缩包"""
+    global _zip_cache_bytes
+    with _zip_cache_lock:
+        keep = _zip_cache_keep()
+        now = time.time()
+        try:
+            with os.scandir(FOLDERZIP_DIR) as it:
+                for entry in it:
+                    if entry.name.endswith('.tmp') and entry.path not in keep and \
+                            now - entry.stat().st_mtime > ZIP_TMP_MAX_AGE:
+                        os.remove(entry.path)
+                        print(f"已删除残留的打包临时文件: {entry.name}")
+        except OSError as e:
+            print(f"清理 ZIP 文件失败: {e}")
+        _zip_cache_bytes = _zip_cache_enforce()
+
+def clear_zip_cache():
+    """删除全部压缩包缓存和布局文件（正在使用的除外），返回删除的文件数"""
+    global _zip_cache_bytes
+    deleted_count = 0
+    with _zip_cache_lock:
+        keep = _zip_cache_keep()
+        for filename in os.listdir(FOLDERZIP_DIR):
+            filepath = os.path.join(FOLDERZIP_DIR, filename)
+            if filename.endswith(('.zip', '.json')) and filepath not in keep:
+                try:
+                    os.remove(filepath)
+                    deleted_count += 1
+                except OSError:
+                    pass
+        _zip_cache_bytes = None
+    return deleted_count
+
+# --- 后台定时清理任务 ---
+def schedule_cleanup():
+    """每小时执行一次清理任务"""
+    cleanup_zip_cache()
+    cleanup_stale_uploads()
+    cleanup_jobs()
+    # 设置下次执行
+    timer = threading.Timer(3600, schedule_cleanup)
+    timer.daemon = True
+    timer.start()
 
 # --- 路由：访问分享链接（显示详情页）---
 @app.route('/s/<token>')
@@ -836,14 +3830,8 @@ def access_share(token):
                     is_dir = os.path.isdir(abs_path)
                     
                     if is_dir:
-                        # 计算文件夹大小
-                        dir_size = 0
-                        for dirpath, dirnames, filenames in os.walk(abs_path):
-                            for f in filenames:
-                                fp = os.path.join(dirpath, f)
-                                if os.path.exists(fp):
-                                    dir_size += os.path.getsize(fp)
-                        size_bytes = dir_size
+                        # 文件夹大小直接读取索引中的递归统计
+                        size_bytes, _ = get_folder_stats(abs_path)
                         file_type = 'folder'
                         type_text = '文件夹'
                     else:
@@ -938,13 +3926,8 @@ def access_share(token):
             
             if is_dir:
                 file_type = 'folder'
-                # 计算文件夹大小
-                total_size = 0
-                for dirpath, dirnames, filenames in os.walk(abs_path):
-                    for f in filenames:
-                        fp = os.path.join(dirpath, f)
-                        if os.path.exists(fp):
-                            total_size += os.path.getsize(fp)
+                # 文件夹大小直接读取索引中的递归统计
+                total_size, _ = get_folder_stats(abs_path)
                 file_size = f"{total_size/1024/1024:.2f} MB"
             else:
                 file_type = get_file_type(file_name)
@@ -1012,57 +3995,28 @@ def share_download(token):
     # 下载文件
     try:
         if link.is_batch:
-            # 批量下载：打包成 ZIP
-            file_paths = link.file_path.split('|')
+            # 批量下载：流式打包成 ZIP，文件夹以自身名称作为归档内的目录
+            members = []
+            for path in link.file_path.split('|'):
+                try:
+                    abs_path = get_safe_path(path)
+                    if not os.path.exists(abs_path):
+                        continue
+                    prefix = os.path.basename(abs_path) if os.path.isdir(abs_path) else ''
+                    members.extend(collect_zip_members(abs_path, prefix))
+                except Exception as e:
+                    print(f"打包文件失败 {path}: {e}")
             
-            # 创建临时 ZIP 文件
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            random_str = shortuuid.uuid()[:6]
-            zip_name = f"batch_share_{timestamp}_{random_str}.zip"
-            zip_path = os.path.join(FOLDERZIP_DIR, zip_name)
-            
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for path in file_paths:
-                    try:
-                        abs_path = get_safe_path(path)
-                        if not os.path.exists(abs_path):
-                            continue
-                        
-                        if os.path.isdir(abs_path):
-                            # 添加文件夹
-                            folder_name = os.path.basename(abs_path)
-                            for root, dirs, files in os.walk(abs_path):
-                                for file in files:
-                                    file_path = os.path.join(root, file)
-                                    arcname = os.path.join(folder_name, os.path.relpath(file_path, abs_path))
-                                    zipf.write(file_path, arcname)
-                        else:
-                            # 添加文件
-                            zipf.write(abs_path, os.path.basename(abs_path))
-                    except Exception as e:
-                        print(f"打包文件失败 {path}: {e}")
-            
-            return send_file(
-                zip_path,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name=f"批量分享_{timestamp}.zip"
-            )
+            return zip_download_response(members, f"批量分享_{timestamp}.zip")
         else:
             # 单个文件下载
             abs_path = get_safe_path(link.file_path)
             if os.path.isdir(abs_path):
                 # 如果是文件夹，打包为 ZIP 下载
                 folder_name = os.path.basename(abs_path)
-                zip_path = zip_folder(abs_path, folder_name)
-                
-                return send_file(
-                    zip_path,
-                    mimetype='application/zip',
-                    as_attachment=True,
-                    download_name=f"{folder_name}.zip"
-                )
-            return send_file(abs_path, as_attachment=True)
+                return zip_download_response(collect_zip_members(abs_path), f"{folder_name}.zip")
+            return file_response(abs_path, as_attachment=True)
     except Exception as e:
         print(f"分享下载失败: {e}")
         import traceback
@@ -1098,17 +4052,10 @@ def share_download_single(token, index):
         if os.path.isdir(abs_path):
             # 如果是文件夹，打包为 ZIP 下载
             folder_name = os.path.basename(abs_path)
-            zip_path = zip_folder(abs_path, folder_name)
-            
-            return send_file(
-                zip_path,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name=f"{folder_name}.zip"
-            )
+            return zip_download_response(collect_zip_members(abs_path), f"{folder_name}.zip")
         else:
             # 直接下载文件
-            return send_file(abs_path, as_attachment=True)
+            return file_response(abs_path, as_attachment=True)
     except Exception as e:
         print(f"单个文件下载失败: {e}")
         import traceback
@@ -1181,7 +4128,7 @@ def share_file(token):
         file_type = get_file_type(filename)
         
         if file_type == 'pdf':
-            return send_file(abs_path, mimetype='application/pdf')
+            return file_response(abs_path, mimetype='application/pdf')
         elif file_type == 'office':
             ext = os.path.splitext(filename.lower())[1]
             mime_types = {
@@ -1192,7 +4139,7 @@ def share_file(token):
                 '.ppt': 'application/vnd.ms-powerpoint',
                 '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
             }
-            return send_file(abs_path, mimetype=mime_types.get(ext, 'application/octet-stream'))
+            return file_response(abs_path, mimetype=mime_types.get(ext, 'application/octet-stream'))
         else:
             abort(404)
     except:
@@ -1209,6 +4156,10 @@ def share_thumbnail(token):
     if link.expire_at and datetime.now() > link.expire_at:
         abort(403)
     
+    preset = request.args.get('size', 'large')
+    if preset not in THUMBNAIL_PRESETS:
+        abort(404)
+    
     try:
         abs_path = get_safe_path(link.file_path)
         
@@ -1218,24 +4169,7 @@ def share_thumbnail(token):
         # 只为图片生成缩略图
         if is_image(abs_path):
             try:
-                img = Image.open(abs_path)
-                # 转换 RGBA 到 RGB
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                    img = background
-                
-                # 生成缩略图
-                img.thumbnail((400, 400), Image.Resampling.LANCZOS)
-                
-                # 保存到内存
-                img_io = io.BytesIO()
-                img.save(img_io, 'JPEG', quality=85)
-                img_io.seek(0)
-                
-                return send_file(img_io, mimetype='image/jpeg')
+                return thumbnail_response(abs_path, preset)
             except Exception as e:
                 print(f"缩略图生成失败: {e}")
                 abort(404)
@@ -1249,6 +4183,10 @@ def share_thumbnail(token):
 @login_required
 def thumbnail():
     path = request.args.get('path')
+    preset = request.args.get('size', 'medium')
+    if preset not in THUMBNAIL_PRESETS:
+        abort(404)
+    
     try:
         abs_path = get_safe_path(path)
         
@@ -1258,24 +4196,7 @@ def thumbnail():
         # 只为图片生成缩略图
         if is_image(abs_path):
             try:
-                img = Image.open(abs_path)
-                # 转换 RGBA 到 RGB
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                    img = background
-                
-                # 生成缩略图
-                img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-                
-                # 保存到内存
-                img_io = io.BytesIO()
-                img.save(img_io, 'JPEG', quality=85)
-                img_io.seek(0)
-                
-                return send_file(img_io, mimetype='image/jpeg')
+                return thumbnail_response(abs_path, preset)
             except Exception as e:
                 print(f"缩略图生成失败: {e}")
                 abort(404)
@@ -1284,6 +4205,72 @@ def thumbnail():
     except:
         abort(404)
 
+# --- 接口：批量获取缩略图 ---
+# 一次请求返回多张缩略图，响应体为：4 字节大端头部长度 + JSON 头部 + 依次拼接的图片数据，
+# 头部 items 记录每个路径在数据区中的 [偏移, 长度]；无法生成缩略图的路径不出现在 items 中。
+# 未缓存的图片由线程池并发提交给渲染进程，同时生成的张数受渲染进程数限制。
+# 批量响应是 POST，浏览器不会缓存（private, no-cache）；单张的 GET /thumbnail 仍是可被 HTTP 缓存的地址，
+# 前端在批量结果缺失或请求失败时回退到它
+THUMBNAIL_BATCH_MAX = 200  # 单次请求最多包含的路径数
+_thumb_batch_pool = None   # 批量请求中读取/生成缩略图的线程池，大小与渲染进程数一致
+_thumb_batch_pool_lock = threading.Lock()
+
+def _thumb_get_batch_pool():
+    global _thumb_batch_pool
+    with _thumb_batch_pool_lock:
+        if _thumb_batch_pool is None:
+            _thumb_batch_pool = ThreadPoolExecutor(app.config['RENDER_WORKERS'])
+        return _thumb_batch_pool
+
+def _read_thumbnail(abs_path, max_size, fmt):
+    with open(get_cached_thumbnail(abs_path, max_size, fmt), 'rb') as f:
+        return f.read()
+
+@app.route('/api/thumbnails', methods=['POST'])
+@login_required
+def batch_thumbnails():
+    data = request.json or {}
+    paths = data.get('paths')
+    preset = data.get('size', 'medium')
+    if not isinstance(paths, list) or preset not in THUMBNAIL_PRESETS:
+        return jsonify({'status': 'error', 'msg': '参数无效'}), 400
+    if len(paths) > THUMBNAIL_BATCH_MAX:
+        return jsonify({'status': 'error', 'msg': f'单次最多请求 {THUMBNAIL_BATCH_MAX} 张缩略图'}), 400
+    
+    fmt = thumbnail_format(request.accept_mimetypes)
+    pool = _thumb_get_batch_pool()
+    futures = []
+    for path in dict.fromkeys(p for p in paths if isinstance(p, str)):
+        try:
+            abs_path = get_safe_path(path)
+            if not os.path.isfile(abs_path) or not is_image(abs_path):
+                continue
+        except Exception as e:
+            print(f"缩略图生成失败 {path}: {e}")
+            continue
+        futures.append((path, pool.submit(_read_thumbnail, abs_path, THUMBNAIL_PRESETS[preset], fmt)))
+    
+    items = {}
+    chunks = []
+    offset = 0
+    for path, future in futures:
+        try:
+            content = future.result()
+        except Exception as e:
+            print(f"缩略图生成失败 {path}: {e}")
+            continue
+        items[path] = [offset, len(content)]
+        chunks.append(content)
+        offset += len(content)
+    
+    header = json.dumps({'mimetype': 'image/webp' if fmt == 'WEBP' else 'image/jpeg', 'items': items},
+                        ensure_ascii=False).encode('utf-8')
+    response = app.response_class(b''.join([struct.pack('>I', len(header)), header] + chunks),
+                                  mimetype='application/octet-stream')
+    response.vary.add('Accept')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 # --- 路由：查看压缩包内容 ---
 @app.route('/archive-view')
 @login_required
@@ -1538,6 +4525,24 @@ def convert_pptx_to_html(pptx_path):
     except Exception as e:
         return f'<div class="alert alert-danger">PPT 文档解析失败: {str(e)}</div>'
 
+# --- 辅助函数：在渲染进程池中将 Office 文档转换为 HTML ---
+_OFFICE_CONVERTERS = {
+    '.docx': convert_docx_to_html, '.doc': convert_docx_to_html,
+    '.xlsx': convert_xlsx_to_html, '.xls': convert_xlsx_to_html,
+    '.pptx': convert_pptx_to_html, '.ppt': convert_pptx_to_html
+}
+
+def render_office_html(abs_path):
+    converter = _OFFICE_CONVERTERS.get(os.path.splitext(abs_path.lower())[1])
+    if converter is None:
+        return ''
+    try:
+        return run_render_job(converter, abs_path)
+    except TimeoutError:
+        return '<div class="alert alert-danger">文档过大，转换超时</div>'
+    except Exception as e:
+        return f'<div class="alert alert-danger">文档转换失败: {str(e)}</div>'
+
 # --- 路由：预览文件 ---
 @app.route('/preview')
 @login_required
@@ -1553,15 +4558,7 @@ def preview():
         
         # Office 文档转换为 HTML 预览
         if file_type == 'office':
-            file_ext = os.path.splitext(filename.lower())[1]
-            html_content = ''
-            
-            if file_ext in ['.docx', '.doc']:
-                html_content = convert_docx_to_html(abs_path)
-            elif file_ext in ['.xlsx', '.xls']:
-                html_content = convert_xlsx_to_html(abs_path)
-            elif file_ext in ['.pptx', '.ppt']:
-                html_content = convert_pptx_to_html(abs_path)
+            html_content = render_office_html(abs_path)
             
             # 获取主题和背景设置
             theme = get_setting('theme', 'light')
@@ -1610,13 +4607,13 @@ def get_file():
         file_type = get_file_type(filename)
         
         if file_type == 'image':
-            return send_file(abs_path)
+            return file_response(abs_path)
         elif file_type == 'video':
-            return send_file(abs_path)
+            return file_response(abs_path)
         elif file_type == 'audio':
-            return send_file(abs_path)
+            return file_response(abs_path)
         elif file_type == 'pdf':
-            return send_file(abs_path, mimetype='application/pdf')
+            return file_response(abs_path, mimetype='application/pdf')
         elif file_type == 'office':
             # Office 文档直接发送
             ext = os.path.splitext(filename.lower())[1]
@@ -1628,7 +4625,7 @@ def get_file():
                 '.ppt': 'application/vnd.ms-powerpoint',
                 '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
             }
-            return send_file(abs_path, mimetype=mime_types.get(ext, 'application/octet-stream'))
+            return file_response(abs_path, mimetype=mime_types.get(ext, 'application/octet-stream'))
         else:
             abort(404)
     except:
@@ -1644,16 +4641,8 @@ def download():
         if os.path.isdir(abs_path):
             # 如果是文件夹，打包为 ZIP 下载
             folder_name = os.path.basename(abs_path) or 'storage'
-            zip_path = zip_folder(abs_path, folder_name)
-            
-            # 不再下载后删除，保留24小时
-            return send_file(
-                zip_path,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name=f"{folder_name}.zip"
-            )
-        return send_file(abs_path, as_attachment=True)
+            return zip_download_response(collect_zip_members(abs_path), f"{folder_name}.zip")
+        return file_response(abs_path, as_attachment=True)
     except Exception as e:
         print(f"下载失败: {e}")
         import traceback
@@ -2043,7 +5032,102 @@ def extract_single_file():
         traceback.print_exc()
         return jsonify({'status': 'error', 'msg': f'提取失败: {str(e)}'})
 
+# --- 辅助函数：解压压缩包 ---
+def extract_archive_to(abs_file_path, extract_folder, progress):
+    """把压缩包解压到 extract_folder，逐个条目解压并汇报进度，条目之间检查是否已取消"""
+    file_ext = abs_file_path.lower()
+    
+    if file_ext.endswith('.zip'):
+        # 解压 ZIP 文件
+        import zipfile
+        with zipfile.ZipFile(abs_file_path, 'r') as zip_ref:
+            # 处理中文文件名编码问题
+            for file_info in zip_ref.filelist:
+                try:
+                    # 尝试使用 UTF-8 解码
+                    file_info.filename = file_info.filename.encode('cp437').decode('utf-8')
+                except:
+                    try:
+                        # 尝试使用 GBK 解码
+                        file_info.filename = file_info.filename.encode('cp437').decode('gbk')
+                    except:
+                        pass
+            progress.set_total(len(zip_ref.filelist), sum(info.file_size for info in zip_ref.filelist))
+            for file_info in zip_ref.filelist:
+                progress.check()
+                zip_ref.extract(file_info, extract_folder)
+                progress.advance(file_info.file_size, 1)
+    
+    elif file_ext.endswith(('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')):
+        # 解压 TAR 文件：边读边解压，不预先扫描整个（压缩的）归档，进度按已读取的压缩包字节数计算
+        import tarfile
+        progress.set_total(None, os.path.getsize(abs_file_path))
+        with open(abs_file_path, 'rb') as raw, tarfile.open(fileobj=raw, mode='r:*') as tar_ref:
+            position = 0
+            for member in tar_ref:
+                progress.check()
+                tar_ref.extract(member, extract_folder)
+                progress.advance(raw.tell() - position, 1 if member.isfile() else 0)
+                position = raw.tell()
+    
+    elif file_ext.endswith(('.gz', '.bz2')):
+        # 解压单个 GZ/BZ2 文件
+        if file_ext.endswith('.gz'):
+            import gzip
+            opener = lambda raw: gzip.GzipFile(fileobj=raw)
+        else:
+            import bz2
+            opener = bz2.BZ2File
+        output_file = os.path.join(extract_folder, os.path.splitext(os.path.basename(abs_file_path))[0])
+        progress.set_total(1, os.path.getsize(abs_file_path))
+        with open(abs_file_path, 'rb') as raw, opener(raw) as f_in, open(output_file, 'wb') as f_out:
+            position = 0
+            while True:
+                data = f_in.read(1024 * 1024)
+                if not data:
+                    break
+                f_out.write(data)
+                progress.advance(raw.tell() - position)
+                position = raw.tell()
+        progress.advance(files=1)
+    
+    elif file_ext.endswith('.rar'):
+        # 解压 RAR 文件（整体解压，只能在完成后汇报进度）
+        try:
+            import rarfile
+        except ImportError:
+            raise RuntimeError('RAR 格式需要安装 rarfile 库，请运行: pip install rarfile')
+        with rarfile.RarFile(abs_file_path, 'r') as rar_ref:
+            rar_ref.extractall(extract_folder)
+    
+    elif file_ext.endswith('.7z'):
+        # 解压 7Z 文件（整体解压，只能在完成后汇报进度）
+        try:
+            import py7zr
+        except ImportError:
+            raise RuntimeError('7Z 格式需要安装 py7zr 库，请运行: pip install py7zr')
+        with py7zr.SevenZipFile(abs_file_path, 'r') as sz_ref:
+            sz_ref.extractall(extract_folder)
+    
+    else:
+        raise RuntimeError('不支持的压缩格式')
+
+@job_handler('extract')
+def job_extract(progress, params):
+    abs_file_path = get_safe_path(params['path'])
+    extract_folder = get_safe_path(params['folder'])
+    try:
+        extract_archive_to(abs_file_path, extract_folder, progress)
+    except BaseException:
+        # 解压失败或被取消时删除解压了一部分的文件夹（由 /api/extract 新建）
+        shutil.rmtree(extract_folder, ignore_errors=True)
+        raise
+    index_update_path(extract_folder)
+    enqueue_ingest(extract_folder)
+    return {'folder': params['folder'], 'msg': f'解压成功，文件已解压到: {os.path.basename(extract_folder)}'}
+
 # --- 接口：解压压缩包 ---
+# 检查参数并新建解压目标文件夹后登记为后台任务，返回任务 ID
 @app.route('/api/extract', methods=['POST'])
 @login_required
 def extract_archive():
@@ -2089,96 +5173,129 @@ def extract_archive():
         
         os.makedirs(extract_folder, exist_ok=True)
         
-        # 根据文件类型解压
-        file_ext = abs_file_path.lower()
-        
-        if file_ext.endswith('.zip'):
-            # 解压 ZIP 文件
-            import zipfile
-            with zipfile.ZipFile(abs_file_path, 'r') as zip_ref:
-                # 处理中文文件名编码问题
-                for file_info in zip_ref.filelist:
-                    try:
-                        # 尝试使用 UTF-8 解码
-                        file_info.filename = file_info.filename.encode('cp437').decode('utf-8')
-                    except:
-                        try:
-                            # 尝试使用 GBK 解码
-                            file_info.filename = file_info.filename.encode('cp437').decode('gbk')
-                        except:
-                            pass
-                zip_ref.extractall(extract_folder)
-                
-        elif file_ext.endswith(('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')):
-            # 解压 TAR 文件
-            import tarfile
-            with tarfile.open(abs_file_path, 'r:*') as tar_ref:
-                tar_ref.extractall(extract_folder)
-                
-        elif file_ext.endswith('.gz') and not file_ext.endswith('.tar.gz'):
-            # 解压单个 GZ 文件
-            import gzip
-            output_file = os.path.join(extract_folder, os.path.splitext(os.path.basename(abs_file_path))[0])
-            with gzip.open(abs_file_path, 'rb') as f_in:
-                with open(output_file, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-                    
-        elif file_ext.endswith('.bz2') and not file_ext.endswith('.tar.bz2'):
-            # 解压单个 BZ2 文件
-            import bz2
-            output_file = os.path.join(extract_folder, os.path.splitext(os.path.basename(abs_file_path))[0])
-            with bz2.open(abs_file_path, 'rb') as f_in:
-                with open(output_file, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-                    
-        elif file_ext.endswith('.rar'):
-            # 解压 RAR 文件
-            try:
-                import rarfile
-                with rarfile.RarFile(abs_file_path, 'r') as rar_ref:
-                    rar_ref.extractall(extract_folder)
-            except ImportError:
-                return jsonify({'status': 'error', 'msg': 'RAR 格式需要安装 rarfile 库，请运行: pip install rarfile'})
-            except Exception as e:
-                return jsonify({'status': 'error', 'msg': f'RAR 解压失败: {str(e)}'})
-            
-        elif file_ext.endswith('.7z'):
-            # 解压 7Z 文件
-            try:
-                import py7zr
-                with py7zr.SevenZipFile(abs_file_path, 'r') as sz_ref:
-                    sz_ref.extractall(extract_folder)
-            except ImportError:
-                return jsonify({'status': 'error', 'msg': '7Z 格式需要安装 py7zr 库，请运行: pip install py7zr'})
-            except Exception as e:
-                return jsonify({'status': 'error', 'msg': f'7Z 解压失败: {str(e)}'})
-            
-        else:
-            return jsonify({'status': 'error', 'msg': '不支持的压缩格式'})
-        
-        return jsonify({
-            'status': 'success', 
-            'msg': f'解压成功，文件已解压到: {os.path.basename(extract_folder)}'
-        })
+        job_id = submit_job('extract', {'path': get_rel_path(abs_file_path), 'folder': get_rel_path(extract_folder)})
+        return jsonify({'status': 'success', 'job_id': job_id})
         
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'status': 'error', 'msg': f'解压失败: {str(e)}'})
 
+# --- 接口：后台任务 ---
+@app.route('/api/jobs')
+@login_required
+def list_jobs():
+    jobs = db.session.execute(db.select(Job).order_by(Job.created_at.desc()).limit(50)).scalars()
+    return jsonify({'status': 'success', 'jobs': [job_status(job) for job in jobs]})
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'msg': '任务不存在'}), 404
+    return jsonify({'status': 'success', 'job': job_status(job)})
+
+@app.route('/api/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    """以 Server-Sent Events 推送任务进度，进度变化时发送一条，任务结束后关闭。
+    每个连接在任务结束前一直占用一个工作线程（见 run_production）"""
+    if db.session.get(Job, job_id) is None:
+        return jsonify({'status': 'error', 'msg': '任务不存在'}), 404
+    
+    def generate():
+        job = last = None
+        interval = JOB_EVENTS_INTERVAL
+        sent_at = time.monotonic()
+        # 响应体在请求上下文结束后才生成，使用独立的应用上下文（数据库会话）
+        with app.app_context():
+            while True:
+                with _jobs_running_lock:
+                    progress = _jobs_running.get(job_id)
+                if progress is None or job is None or job.status != 'running':
+                    # 任务在其他进程执行、尚未开始或刚结束：从数据库读取
+                    job = db.session.get(Job, job_id)
+                    if job is None:
+                        return
+                    db.session.expunge(job) # 保留读到的快照，之后只更新进度
+                    db.session.rollback()   # 结束读事务，下一次读取到最新的状态
+                status = job_status(job, progress)
+                key = {k: v for k, v in status.items() if k != 'eta'} # 剩余时间随时间变化，不算作进度变化
+                if key != last:
+                    last, sent_at = key, time.monotonic()
+                    interval = JOB_EVENTS_INTERVAL
+                    yield f"data: {json.dumps(status, ensure_ascii=False)}\n\n"
+                else:
+                    if progress is None:
+                        interval = min(interval * 2, JOB_EVENTS_MAX_INTERVAL)
+                    if time.monotonic() - sent_at >= JOB_EVENTS_KEEPALIVE:
+                        sent_at = time.monotonic()
+                        yield ": keep-alive\n\n" # 注释行，防止代理因长时间无数据断开连接
+                if status['status'] in ('done', 'failed', 'cancelled'):
+                    return
+                time.sleep(interval if progress is None else JOB_EVENTS_INTERVAL)
+    
+    return app.response_class(generate(), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job_route(job_id):
+    if db.session.get(Job, job_id) is None:
+        return jsonify({'status': 'error', 'msg': '任务不存在'}), 404
+    cancel_job(job_id)
+    return jsonify({'status': 'success'})
+
+@app.route('/api/jobs/zip', methods=['POST'])
+@login_required
+def zip_job():
+    path = (request.json or {}).get('path')
+    try:
+        if not os.path.isdir(get_safe_path(path)):
+            return jsonify({'status': 'error', 'msg': '文件夹不存在'})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'msg': str(e)})
+    job_id = submit_job('zip', {'path': path})
+    return jsonify({'status': 'success', 'job_id': job_id})
+
+# --- 接口：打包下载缓存统计 ---
+@app.route('/api/zip-cache-stats')
+@login_required
+def zip_cache_stats():
+    total_bytes = archives = 0
+    with os.scandir(FOLDERZIP_DIR) as it:
+        for entry in it:
+            if entry.is_file():
+                total_bytes += entry.stat().st_size
+                if entry.name.endswith('.zip'):
+                    archives += 1
+    with _zip_cache_lock:
+        stats = dict(_zip_cache_stats)
+    requests_count = stats['hits'] + stats['joins'] + stats['misses']
+    with _zip_builds_lock:
+        building = len(_zip_builds)
+    return jsonify({
+        'status': 'success',
+        'size': total_bytes,
+        'max_size': app.config['ZIP_CACHE_MAX_BYTES'],
+        'archives': archives,
+        'building': building,
+        'downloading': sum(_zip_cache_in_use.values()),
+        'hit_rate': round(stats['hits'] / requests_count, 4) if requests_count else None,
+        **stats
+    })
+
 # --- 接口：清空缓存 ---
 @app.route('/api/clear-cache', methods=['POST'])
 @login_required
 def clear_cache():
     try:
         # 清空 folderzip 目录中的所有 ZIP 文件
-        deleted_count = 0
-        if os.path.exists(FOLDERZIP_DIR):
-            for filename in os.listdir(FOLDERZIP_DIR):
-                filepath = os.path.join(FOLDERZIP_DIR, filename)
-                if os.path.isfile(filepath) and filename.endswith('.zip'):
-                    os.remove(filepath)
-                    deleted_count += 1
+        deleted_count = clear_zip_cache()
+        
+        # 清空缩略图缓存
+        deleted_count += clear_thumbnail_cache()
         
         # 清空旧的背景图片（保留当前使用的）
         current_bg = get_setting('background_image', 'bg.png')
@@ -2214,10 +5331,11 @@ def clear_all_data():
             shutil.rmtree(STORAGE_DIR)
             os.makedirs(STORAGE_DIR)
         
-        # 2. 删除所有 ZIP 文件
+        # 2. 删除所有 ZIP 文件和缩略图缓存
         if os.path.exists(FOLDERZIP_DIR):
             shutil.rmtree(FOLDERZIP_DIR)
             os.makedirs(FOLDERZIP_DIR)
+        clear_thumbnail_cache()
         
         # 3. 删除所有上传的背景图片
         if os.path.exists(STATIC_DIR):
@@ -2227,8 +5345,10 @@ def clear_all_data():
                     if os.path.isfile(filepath):
                         os.remove(filepath)
         
-        # 4. 清空数据库中的分享链接
+        # 4. 清空数据库中的分享链接、文件索引和后处理队列
         ShareLink.query.delete()
+        FileEntry.query.delete()
+        IngestTask.query.delete()
         
         # 5. 清空密码重置令牌
         PasswordResetToken.query.delete()
@@ -2256,7 +5376,113 @@ def clear_all_data():
         db.session.rollback()
         return jsonify({'status': 'error', 'msg': str(e)})
 
+# --- 应用初始化与后台维护进程 ---
+# 导入 app.py 不再有副作用，由 create_app() 完成初始化（python app.py、gunicorn 'app:create_app()' 都经过这里）。
+# 多个工作进程同时启动时，目录创建、数据库迁移和默认设置在 instance/init.lock 文件锁内串行执行，只有第一个进程真正执行；
+# 索引对账、缓存清理和上传后处理这些后台任务只在持有 instance/maintenance.lock 的一个进程中运行，
+# 该进程退出后，其他进程在 MAINTENANCE_ELECT_INTERVAL 秒内接手
+MAINTENANCE_ELECT_INTERVAL = 60
+_app_initialized = False
+_app_init_lock = threading.Lock()
+_maintenance_lock_file = None  # 维护进程持有的锁文件，进程存活期间保持打开
+
+def _lock_file(path, blocking=True):
+    """对 path 加排他锁，返回打开的文件（关闭即释放）；非阻塞模式下锁已被其他进程持有时返回 None"""
+    f = open(path, 'a+b')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        else:
+            # lockf 的锁属于进程，渲染进程池 fork 出的子进程不会继承
+            import fcntl
+            fcntl.lockf(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f
+    except OSError:
+        f.close()
+        if blocking:
+            raise
+        return None
+
+def elect_maintenance_runner():
+    """拿到 maintenance.lock 的进程启动后台任务；没拿到的进程定时重试，以便在维护进程退出后接手"""
+    global _maintenance_lock_file
+    lock_file = _lock_file(os.path.join(app.instance_path, 'maintenance.lock'), blocking=False)
+    if lock_file is None:
+        timer = threading.Timer(MAINTENANCE_ELECT_INTERVAL, elect_maintenance_runner)
+        timer.daemon = True
+        timer.start()
+        return
+    
+    _maintenance_lock_file = lock_file
+    print(f"进程 {os.getpid()} 负责后台维护任务")
+    schedule_file_index_reconcile(delay=0)
+    schedule_cleanup()
+    start_ingest_workers()
+
+def create_app():
+    """初始化并返回 app，可重复调用：每个进程只初始化一次"""
+    global _app_initialized
+    with _app_init_lock:
+        if _app_initialized:
+            return app
+        for directory in (STORAGE_DIR, FOLDERZIP_DIR, THUMB_CACHE_DIR, STATIC_DIR, app.instance_path):
+            os.makedirs(directory, exist_ok=True)
+        lock_file = _lock_file(os.path.join(app.instance_path, 'init.lock'))
+        try:
+            with app.app_context():
+                init_database()
+            init_file_search_index()
+        finally:
+            lock_file.close()
+        _app_initialized = True
+        elect_maintenance_runner()
+        start_job_workers()
+    return app
+
+@app.before_request
+def _ensure_initialized():
+    # 兼容直接以 app:app 启动（没有调用 create_app）的部署方式
+    if not _app_initialized:
+        create_app()
+
+# gthread 模式下每个请求在响应发送完之前占用工作进程的一个线程。任务进度推送（/api/jobs/<id>/events）
+# 在任务结束前一直保持连接，同时观察 N 个任务就长期占用 N 个线程；打开多个任务进度的用户较多时
+# 应相应增加 --threads，否则普通请求要排队等待空闲线程
+def run_production(host='0.0.0.0', port=5000, workers=None, threads=8):
+    """多进程、多线程的生产服务（gunicorn gthread），每个工作进程各自调用 create_app()"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("生产模式需要安装 gunicorn：pip install gunicorn")
+        print("Windows 可使用 waitress：waitress-serve --threads=16 --call app:create_app")
+        sys.exit(1)
+    
+    class NetDiskServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers or os.cpu_count() or 1)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+        
+        def load(self):
+            return create_app()
+    
+    NetDiskServer().run()
+
 # --- 主程序入口
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    import argparse
+    parser = argparse.ArgumentParser(description='NetDisk 网盘')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--production', action='store_true', help='使用 gunicorn 多进程多线程运行')
+    parser.add_argument('--workers', type=int, default=None, help='生产模式的工作进程数，默认 CPU 核数')
+    parser.add_argument('--threads', type=int, default=8, help='生产模式每个工作进程的线程数')
+    args = parser.parse_args()
+    if args.production:
+        run_production(args.host, args.port, args.workers, args.threads)
+    else:
+        create_app().run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,136 @@
+"""目录列表基准测试：旧版 listdir + isdir/getsize/getmtime 与 scan_directory 对比
+
+用法：
+    python benchmarks/bench_listing.py [条目数量，默认 100000]
+
+在临时目录中生成指定数量的文件（每 50 个文件夹一个子目录），
+分别统计两种实现的 stat 系统调用次数和耗时。
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as netdisk
+
+
+def legacy_listing(abs_path, req_path=''):
+    """index() 改造前的实现（逐条 isdir/getsize/getmtime）"""
+    files_list = []
+    for item in os.listdir(abs_path):
+        if item.startswith('.'): continue
+        full_item_path = os.path.join(abs_path, item)
+        is_dir = os.path.isdir(full_item_path)
+        size = os.path.getsize(full_item_path) if not is_dir else 0
+        mtime_timestamp = os.path.getmtime(full_item_path)
+        mtime = time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime_timestamp))
+        files_list.append({
+            'name': item,
+            'is_dir': is_dir,
+            'size': f"{size/1024/1024:.2f} MB" if not is_dir else "-",
+            'size_bytes': size,
+            'mtime': mtime,
+            'mtime_timestamp': mtime_timestamp,
+            'rel_path': os.path.join(req_path, item).replace('\\', '/'),
+            'file_type': 'folder' if is_dir else netdisk.get_file_type(item)
+        })
+    return files_list
+
+
+def make_tree(root, count):
+    exts = ['.jpg', '.mp4', '.txt', '.zip', '.docx', '.pdf', '.mp3', '.bin']
+    for i in range(count):
+        if i % 50 == 0:
+            os.mkdir(os.path.join(root, f"dir_{i:06d}"))
+        else:
+            with open(os.path.join(root, f"file_{i:06d}{exts[i % len(exts)]}"), 'wb') as f:
+                f.write(b'x' * (i % 4096))
+
+
+class _CountingEntry:
+    """包装 DirEntry，统计真正触发 stat 系统调用的次数（DirEntry 会缓存结果）"""
+    def __init__(self, entry, counter):
+        self._entry = entry
+        self._counter = counter
+        self._stat = None
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_dir(self, follow_symlinks=True):
+        # Linux/Windows 上目录项类型随 readdir 一起返回，不产生额外 stat
+        return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def stat(self, follow_symlinks=True):
+        if self._stat is None:
+            self._counter[0] += 1
+            self._stat = self._entry.stat(follow_symlinks=follow_symlinks)
+        return self._stat
+
+
+def count_stat_calls(func, abs_path):
+    counter = [0]
+    real_stat = os.stat
+    real_scandir = os.scandir
+
+    def counting_stat(*args, **kwargs):
+        counter[0] += 1
+        return real_stat(*args, **kwargs)
+
+    class counting_scandir:
+        def __init__(self, path):
+            self._it = real_scandir(path)
+
+        def __enter__(self):
+            return (_CountingEntry(e, counter) for e in self._it)
+
+        def __exit__(self, *exc):
+            self._it.close()
+
+    os.stat = counting_stat
+    os.scandir = counting_scandir
+    try:
+        func(abs_path)
+    finally:
+        os.stat = real_stat
+        os.scandir = real_scandir
+    return counter[0]
+
+
+def best_of(func, abs_path, rounds=3):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(abs_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    root = tempfile.mkdtemp(prefix='netdisk_bench_')
+    try:
+        print(f"生成 {count} 个条目: {root}")
+        make_tree(root, count)
+
+        results = []
+        for label, func in (('listdir + isdir/getsize/getmtime', legacy_listing),
+                            ('scan_directory (os.scandir)', netdisk.scan_directory)):
+            calls = count_stat_calls(func, root)
+            elapsed = best_of(func, root)
+            results.append((label, calls, elapsed))
+
+        print(f"{'实现':<36}{'stat 调用':>12}{'耗时(秒)':>12}")
+        for label, calls, elapsed in results:
+            print(f"{label:<36}{calls:>12}{elapsed:>12.3f}")
+        legacy, current = results
+        print(f"stat 调用减少 {legacy[1] - current[1]} 次，耗时缩短为原来的 {current[2] / legacy[2]:.0%}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
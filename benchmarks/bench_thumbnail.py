@@ -0,0 +1,132 @@
+"""缩略图基准测试：改造前的 thumbnail() 实现与 render_thumbnail 对比
+
+用法：
+    python benchmarks/bench_thumbnail.py [图片数量，默认 5] [宽x高，默认 7296x5472（约 40MP）]
+
+在临时目录中生成指定数量的大尺寸 JPEG 和 PNG，每种实现在独立子进程中运行，
+统计单张图片的平均耗时和渲染过程中峰值 RSS 的增量（依赖 resource 模块，仅支持 Linux/macOS）。
+子进程会继承父进程的峰值 RSS，因此生成图片也放在单独的子进程中完成，主进程保持很小的内存占用。
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import resource
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+
+def legacy_thumbnail(abs_path, max_size):
+    """改造前 thumbnail() 路由中的实现（完整解码后再缩放）"""
+    img = Image.open(abs_path)
+    # 转换 RGBA 到 RGB
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+
+    # 生成缩略图
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    # 保存到内存
+    img_io = io.BytesIO()
+    img.save(img_io, 'JPEG', quality=85)
+    return img_io.getvalue()
+
+
+def make_images(root, count, size):
+    """生成带渐变和噪点的图片，避免纯色图片被编码器过度压缩"""
+    base = Image.merge('RGB', (
+        Image.linear_gradient('L').resize(size),
+        Image.effect_noise(size, 64),
+        Image.radial_gradient('L').resize(size),
+    ))
+    paths = []
+    for i in range(count):
+        if i % 2 == 0:
+            path = os.path.join(root, f"photo_{i}.jpg")
+            exif = Image.Exif()
+            exif[0x0112] = 6 if i % 4 == 0 else 1  # 一半 JPEG 带旋转方向
+            base.save(path, 'JPEG', quality=90, exif=exif)
+        else:
+            path = os.path.join(root, f"image_{i}.png")
+            rgba = base.convert('RGBA')
+            rgba.putalpha(Image.linear_gradient('L').resize(size))
+            rgba.save(path, 'PNG', compress_level=1)
+        paths.append(path)
+    return paths
+
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss  # macOS 单位为字节
+
+
+def worker(impl, paths):
+    """子进程：只运行一种实现，输出平均耗时和峰值 RSS 增量"""
+    import app as netdisk
+    if impl == 'legacy':
+        render = lambda p: legacy_thumbnail(p, (200, 200))
+    else:
+        fmt = 'WEBP' if impl == 'webp' else 'JPEG'
+        render = lambda p: netdisk.render_thumbnail(p, netdisk.THUMBNAIL_PRESETS['medium'], fmt)
+
+    baseline = peak_rss_kb()
+    timings = {}
+    for path in paths:
+        start = time.perf_counter()
+        data = render(path)
+        timings[os.path.basename(path)] = (time.perf_counter() - start, len(data))
+    print(json.dumps({'timings': timings, 'rss_kb': peak_rss_kb() - baseline}))
+
+
+def run_worker(*args):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__)] + list(args),
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    width, height = (int(v) for v in (sys.argv[2] if len(sys.argv) > 2 else '7296x5472').split('x'))
+    root = tempfile.mkdtemp(prefix='netdisk_thumb_bench_')
+    try:
+        print(f"生成 {count} 张 {width}x{height} 图片: {root}")
+        paths = run_worker('--generate', root, str(count), str(width), str(height))
+
+        jpeg_paths = [p for p in paths if p.endswith('.jpg')]
+        png_paths = [p for p in paths if p.endswith('.png')]
+        print(f"{'实现':<28}{'JPEG 平均(ms)':>14}{'JPEG 峰值RSS(MB)':>18}{'PNG 平均(ms)':>14}{'PNG 峰值RSS(MB)':>18}{'输出(KB)':>10}")
+        for label, impl in (('thumbnail() 原实现 (JPEG)', 'legacy'),
+                            ('render_thumbnail (JPEG)', 'jpeg'),
+                            ('render_thumbnail (WebP)', 'webp')):
+            # JPEG 和 PNG 分别在独立子进程中运行，峰值 RSS 互不影响
+            row = []
+            outputs = []
+            for group in (jpeg_paths, png_paths):
+                result = run_worker('--worker', impl, *group) if group else {'timings': {}, 'rss_kb': 0}
+                timings = list(result['timings'].values())
+                row.append(sum(t for t, _ in timings) / len(timings) * 1000 if timings else 0)
+                row.append(result['rss_kb'] / 1024)
+                outputs.extend(n for _, n in timings)
+            out_kb = sum(outputs) / len(outputs) / 1024 if outputs else 0
+            print(f"{label:<28}{row[0]:>14.1f}{row[1]:>18.1f}{row[2]:>14.1f}{row[3]:>18.1f}{out_kb:>10.1f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--worker':
+        worker(sys.argv[2], sys.argv[3:])
+    elif len(sys.argv) > 2 and sys.argv[1] == '--generate':
+        print(json.dumps(make_images(sys.argv[2], int(sys.argv[3]), (int(sys.argv[4]), int(sys.argv[5])))))
+    else:
+        main()
@@ -0,0 +1,110 @@
+"""上传基准测试：Werkzeug 表单解析 + file.save() 与 receive_multipart_upload 流式写入对比
+
+用法：
+    python benchmarks/bench_upload.py [文件大小 MB，默认 2048] [临时目录，默认系统临时目录]
+
+构造一个 multipart/form-data 请求体（边读边生成，不占用内存），分别用两种方式接收到临时目录，
+统计写入的字节数（/proc/self/io 中的 wchar 为 write 系统调用写出的字节，
+write_bytes 为实际提交到块设备层的字节）、耗时和吞吐量。仅 Linux 提供 /proc/self/io。
+Werkzeug 的临时文件写在系统临时目录（TMPDIR），与存储目录不在同一文件系统时还会多一次跨盘复制。
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as netdisk
+
+BOUNDARY = 'netdiskbenchboundary'
+BLOCK = os.urandom(1024 * 1024)
+
+
+class MultipartBody:
+    """按需生成 path、file、relativePath 三个字段的请求体"""
+    
+    def __init__(self, size):
+        self.parts = [
+            (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="path"\r\n\r\n\r\n'
+             f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="big.bin"\r\n'
+             'Content-Type: application/octet-stream\r\n\r\n').encode(),
+            size,
+            (f'\r\n--{BOUNDARY}\r\nContent-Disposition: form-data; name="relativePath"\r\n\r\nbig.bin\r\n'
+             f'--{BOUNDARY}--\r\n').encode(),
+        ]
+        self.length = len(self.parts[0]) + size + len(self.parts[2])
+        self.pending = b''
+    
+    def read(self, n=-1):
+        while not self.pending and self.parts:
+            part = self.parts[0]
+            if isinstance(part, int):
+                self.pending = BLOCK[:min(part, len(BLOCK))]
+                self.parts[0] = part - len(self.pending)
+                if not self.parts[0]:
+                    self.parts.pop(0)
+            else:
+                self.pending = self.parts.pop(0)
+        if n is None or n < 0:
+            n = len(self.pending)
+        data, self.pending = self.pending[:n], self.pending[n:]
+        return data
+
+
+def io_counters():
+    try:
+        with open('/proc/self/io') as f:
+            return {k: int(v) for k, v in (line.split(': ') for line in f)}
+    except OSError:
+        return {}
+
+
+def legacy_upload(dest_dir):
+    """upload() 改造前的实现：request.files 解析（溢出到临时文件）后 file.save() 复制"""
+    file = netdisk.request.files.get('file')
+    file.save(os.path.join(dest_dir, netdisk.request.form.get('relativePath')))
+
+
+def streaming_upload(dest_dir):
+    fields, received = netdisk.receive_multipart_upload()
+    for tmp_path, filename in received:
+        os.replace(tmp_path, os.path.join(dest_dir, fields.get('relativePath') or filename))
+
+
+def run(func, size, dest_dir):
+    body = MultipartBody(size)
+    before = io_counters()
+    wall = time.perf_counter()
+    environ = {'wsgi.input': body, 'CONTENT_LENGTH': str(body.length),
+               'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}'}
+    with netdisk.app.test_request_context('/upload', method='POST', environ_overrides=environ):
+        func(dest_dir)
+    os.sync()  # 把脏页写回磁盘，write_bytes 才完整
+    wall = time.perf_counter() - wall
+    after = io_counters()
+    target = os.path.join(dest_dir, 'big.bin')
+    assert os.path.getsize(target) == size
+    os.remove(target)
+    return wall, {k: after[k] - before[k] for k in ('wchar', 'write_bytes') if k in after}
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 2048) * 1024 * 1024
+    root = tempfile.mkdtemp(prefix='netdisk_upload_bench_', dir=sys.argv[2] if len(sys.argv) > 2 else None)
+    netdisk.STORAGE_DIR = root
+    try:
+        print(f"上传 {size / 1024 / 1024:.0f} MB 到 {root}")
+        print(f"{'实现':<20}{'耗时(s)':>10}{'吞吐(MB/s)':>14}{'wchar(MB)':>12}{'write_bytes(MB)':>18}")
+        for label, func in (('表单解析+save', legacy_upload), ('流式写入', streaming_upload)):
+            wall, written = run(func, size, root)
+            cells = ''.join(f"{written[k] / 1024 / 1024:>{w}.0f}" if k in written else f"{'-':>{w}}"
+                            for k, w in (('wchar', 12), ('write_bytes', 18)))
+            print(f"{label:<20}{wall:>10.2f}{size / 1024 / 1024 / wall:>14.1f}{cells}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""ZIP 打包基准测试：全部 DEFLATE 与按类型选择压缩方式（zip_compression_for）对比，以及并行压缩的线程数扩展性
+
+用法：
+    python benchmarks/bench_zip.py [总大小 MB，默认 200]
+
+在临时目录中生成混合内容的文件夹：视频、照片、压缩包（随机数据，模拟已压缩格式）、
+文本/日志、BMP 以及未知扩展名的随机和可压缩二进制文件，
+分别统计两种策略打包时的 CPU 时间、耗时和输出大小；
+再以全部 DEFLATE 的方式，统计不同 ZIP_WORKERS 下的耗时和吞吐量。
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import zipfile
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as netdisk
+
+
+def make_text(size, rng):
+    words = ['netdisk', 'upload', 'share', 'folder', 'thumbnail', 'index', 'request', 'error', '200', '404']
+    lines = []
+    total = 0
+    while total < size:
+        line = f"{rng.randint(0, 10**9)} {' '.join(rng.choice(words) for _ in range(12))}\n"
+        lines.append(line)
+        total += len(line)
+    return ''.join(lines).encode('utf-8')[:size]
+
+
+def make_tree(root, total_mb):
+    """按比例生成混合内容，大致模拟照片/视频为主的网盘文件夹"""
+    rng = random.Random(42)
+    total = total_mb * 1024 * 1024
+    layout = [  # (扩展名, 占总大小比例, 单个文件大小, 内容)
+        ('.mp4', 0.40, 20 * 1024 * 1024, 'random'),
+        ('.jpg', 0.25, 3 * 1024 * 1024, 'random'),
+        ('.zip', 0.10, 8 * 1024 * 1024, 'random'),
+        ('.log', 0.10, 2 * 1024 * 1024, 'text'),
+        ('.bmp', 0.05, 4 * 1024 * 1024, 'pattern'),
+        ('.bin', 0.05, 4 * 1024 * 1024, 'random'),
+        ('.dat', 0.05, 4 * 1024 * 1024, 'pattern'),
+    ]
+    for ext, ratio, file_size, kind in layout:
+        folder = os.path.join(root, ext.lstrip('.'))
+        os.makedirs(folder)
+        for i in range(max(1, int(total * ratio // file_size))):
+            if kind == 'random':
+                data = os.urandom(file_size)
+            elif kind == 'text':
+                data = make_text(file_size, rng)
+            else:
+                row = bytes(rng.randrange(0, 256, 16) for _ in range(3072))
+                data = (row * (file_size // len(row) + 1))[:file_size]
+            with open(os.path.join(folder, f"file_{i:04d}{ext}"), 'wb') as f:
+                f.write(data)
+
+
+def deflate_all(name, head=b''):
+    """改造前的行为：所有条目都以默认级别 DEFLATE"""
+    return zipfile.ZIP_DEFLATED, 6
+
+
+def set_workers(count):
+    netdisk.app.config['ZIP_WORKERS'] = count
+    if netdisk._zip_pool is not None:
+        netdisk._zip_pool.shutdown()
+        netdisk._zip_pool = None
+
+
+def run(members):
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    size = sum(len(chunk) for chunk in netdisk.iter_zip_stream(members))
+    return time.process_time() - cpu, time.perf_counter() - wall, size
+
+
+def main():
+    total_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    root = tempfile.mkdtemp(prefix='netdisk_zip_bench_')
+    try:
+        print(f"生成约 {total_mb} MB 混合内容: {root}")
+        make_tree(root, total_mb)
+        members = netdisk.collect_zip_members(root)
+        source = sum(os.path.getsize(p) for _, p in members)
+        run(members)  # 预热页缓存，两种策略都从内存读取源文件
+        
+        policy = netdisk.zip_compression_for
+        print(f"{'策略':<20}{'CPU(s)':>10}{'耗时(s)':>10}{'输出(MB)':>12}{'压缩率':>10}")
+        for label, func in (('全部 DEFLATE', deflate_all), ('按类型选择', policy)):
+            netdisk.zip_compression_for = func
+            cpu, wall, size = run(members)
+            print(f"{label:<20}{cpu:>10.2f}{wall:>10.2f}{size / 1024 / 1024:>12.1f}{size / source:>10.1%}")
+        
+        print(f"\n{'压缩线程数':<16}{'耗时(s)':>10}{'吞吐(MB/s)':>14}")
+        netdisk.zip_compression_for = deflate_all
+        counts = sorted({1, 2, 4, os.cpu_count() or 1})
+        for count in counts:
+            set_workers(count)
+            _, wall, _ = run(members)
+            print(f"{count:<16}{wall:>10.2f}{source / 1024 / 1024 / wall:>14.1f}")
+        netdisk.zip_compression_for = policy
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()